@@ -0,0 +1,245 @@
+import os
+import threading
+
+import numpy as np
+
+from gallery import ENCODING_SIZE
+
+
+def kmeans(data, k, iterations=15, seed=0):
+    """Plain Lloyd's k-means; returns float32 centroids of shape (k, 128)."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    data_norms = np.einsum('ij,ij->i', data, data)
+    for _ in range(iterations):
+        squared = (data_norms[:, None] + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+                   - 2.0 * data @ centroids.T)
+        assignment = np.argmin(squared, axis=1)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty clusters on random points so every list stays usable
+        centroids[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+    return centroids.astype(np.float32)
+
+
+class IVFGallery:
+    """Approximate nearest-neighbour gallery using an inverted file index.
+
+    Encodings are partitioned by k-means into `n_lists` cells. A probe is
+    compared only against the encodings in its `n_probe` nearest cells, so
+    raising `n_probe` trades speed for recall. Until the gallery holds
+    `min_train` encodings it is searched exhaustively. It has the same
+    add/remove/match interface as FaceGallery.
+
+    Removal leaves a tombstone row; once tombstones make up more than
+    `max_tombstones` of the rows they are compacted away, keeping the
+    partition. The partition is retrained after three times its training
+    size has been added, whether the roster grew or was churned.
+    """
+
+    def __init__(self, tolerance=0.45, n_lists=None, n_probe=None, min_train=1024, max_tombstones=0.25):
+        self.tolerance = tolerance
+        self.n_lists = n_lists
+        self.n_probe = int(n_probe or os.getenv('ANN_PROBES', 8))
+        self.min_train = min_train
+        self.max_tombstones = max_tombstones
+        self.centroids = None
+        self._trained_size = 0
+        self._added_since_train = 0
+        self._encodings = np.zeros((256, ENCODING_SIZE), dtype=np.float32)
+        self._norms = np.zeros(256, dtype=np.float32)
+        self._card_ids = np.empty(256, dtype=object)
+        self._assignment = np.full(256, -1, dtype=np.int32)
+        self._size = 0
+        self._live = 0
+        self._rows_by_card = {}
+        # cell -> {row: None}, an insertion-ordered set
+        self._lists = {}
+        self._list_arrays = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._live
+
+    def __contains__(self, card_id):
+        with self._lock:
+            return str(card_id) in self._rows_by_card
+
+    def card_ids(self):
+        with self._lock:
+            return set(self._rows_by_card)
+
+    def _grow(self, needed):
+        capacity = len(self._encodings)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name, fill in (('_encodings', 0), ('_norms', 0), ('_card_ids', None), ('_assignment', -1)):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[...] = fill
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _nearest_lists(self, vectors, count):
+        squared = (np.einsum('ij,ij->i', self.centroids, self.centroids)[None, :]
+                   - 2.0 * vectors @ self.centroids.T)
+        if count >= len(self.centroids):
+            return np.argsort(squared, axis=1)
+        return np.argpartition(squared, count, axis=1)[:, :count]
+
+    def _assign(self, rows):
+        lists = self._nearest_lists(self._encodings[rows], 1)[:, 0]
+        self._assignment[rows] = lists
+        for row, cell in zip(rows, lists):
+            self._lists.setdefault(int(cell), {})[int(row)] = None
+            self._list_arrays.pop(int(cell), None)
+
+    def _index_rows(self):
+        self._rows_by_card = {}
+        for row, card_id in enumerate(self._card_ids[:self._size]):
+            self._rows_by_card.setdefault(card_id, []).append(row)
+
+    def _compact(self):
+        """Drop tombstoned rows, keeping every live row in its cell."""
+        live = np.flatnonzero(self._card_ids[:self._size] != None)  # noqa: E711
+        for name in ('_encodings', '_norms', '_card_ids', '_assignment'):
+            array = getattr(self, name)
+            array[:len(live)] = array[live]
+        self._card_ids[len(live):self._size] = None
+        self._assignment[len(live):self._size] = -1
+        self._size = self._live = len(live)
+        self._index_rows()
+        self._lists, self._list_arrays = {}, {}
+        for row, cell in enumerate(self._assignment[:self._size]):
+            if cell >= 0:
+                self._lists.setdefault(int(cell), {})[row] = None
+
+    def train(self):
+        """(Re)build the k-means partition over all live encodings."""
+        with self._lock:
+            # Compact tombstones away while everything is being reassigned anyway
+            self._compact()
+            k = self.n_lists or max(int(np.sqrt(self._size)), 1)
+            self.centroids = kmeans(self._encodings[:self._size], min(k, self._size))
+            self._lists, self._list_arrays = {}, {}
+            self._assign(np.arange(self._size))
+            self._trained_size = self._size
+            self._added_since_train = 0
+
+    def add_many(self, card_ids, encodings):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            start = self._size
+            self._grow(start + len(encodings))
+            self._encodings[start:start + len(encodings)] = encodings
+            self._norms[start:start + len(encodings)] = np.einsum('ij,ij->i', encodings, encodings)
+            card_ids = [str(card_id) for card_id in card_ids]
+            self._card_ids[start:start + len(encodings)] = card_ids
+            for row, card_id in enumerate(card_ids, start):
+                self._rows_by_card.setdefault(card_id, []).append(row)
+            self._size += len(encodings)
+            self._live += len(encodings)
+            self._added_since_train += len(encodings)
+            if self.centroids is not None:
+                self._assign(np.arange(start, self._size))
+            # Train once there is enough data, and retrain once 3x the trained size has been added
+            if ((self.centroids is None and self._live >= self.min_train)
+                    or (self.centroids is not None and self._added_since_train > 3 * self._trained_size)):
+                self.train()
+
+    def add(self, card_id, encoding):
+        self.add_many([card_id], [encoding])
+
+    def remove(self, card_id):
+        with self._lock:
+            rows = self._rows_by_card.pop(str(card_id), ())
+            for row in rows:
+                cell = int(self._assignment[row])
+                if cell >= 0:
+                    del self._lists[cell][row]
+                    self._list_arrays.pop(cell, None)
+                self._card_ids[row] = None
+                self._assignment[row] = -1
+            self._live -= len(rows)
+            if self._size - self._live > max(self.max_tombstones * self._size, 64):
+                self._compact()
+            return len(rows)
+
+    def replace(self, card_id, encodings):
+        self.remove(card_id)
+        for encoding in encodings:
+            self.add(card_id, encoding)
+
+    def clear(self):
+        """Drop every encoding but keep the trained partition."""
+        with self._lock:
+            self._card_ids[:self._size] = None
+            self._assignment[:self._size] = -1
+            self._size = self._live = 0
+            self._rows_by_card = {}
+            self._lists, self._list_arrays = {}, {}
+
+    def _list_rows(self, cell):
+        rows = self._list_arrays.get(cell)
+        if rows is None:
+            rows = np.fromiter(self._lists.get(cell, ()), dtype=np.int64)
+            self._list_arrays[cell] = rows
+        return rows
+
+    def _best(self, probe, rows):
+        if not len(rows):
+            return None, None
+        squared = self._norms[rows] - 2.0 * (self._encodings[rows] @ probe) + np.dot(probe, probe)
+        index = int(np.argmin(squared))
+        return rows[index], float(np.sqrt(max(squared[index], 0.0)))
+
+    def match_batch(self, probes, tolerance=None, n_probe=None):
+        tolerance = self.tolerance if tolerance is None else tolerance
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        results = []
+        with self._lock:
+            if self.centroids is None:
+                candidate_rows = [np.flatnonzero(self._card_ids[:self._size] != None)] * len(probes)  # noqa: E711
+            else:
+                cells = self._nearest_lists(probes, n_probe or self.n_probe)
+                candidate_rows = [np.concatenate([self._list_rows(int(cell)) for cell in row_cells])
+                                  for row_cells in cells]
+            for probe, rows in zip(probes, candidate_rows):
+                row, distance = self._best(probe, rows)
+                if row is None:
+                    results.append((None, None))
+                else:
+                    results.append((self._card_ids[row] if distance <= tolerance else None, distance))
+        return results
+
+    def match(self, probe, tolerance=None):
+        return self.match_batch([probe], tolerance)[0]
+
+    def save(self, path):
+        with self._lock:
+            tmp_path = path + '.tmp.npz'
+            np.savez(tmp_path,
+                     centroids=self.centroids if self.centroids is not None else np.zeros((0, ENCODING_SIZE), np.float32),
+                     encodings=self._encodings[:self._size],
+                     card_ids=np.array([card_id or '' for card_id in self._card_ids[:self._size]], dtype=str),
+                     params=np.array([self.n_probe, self.min_train, self._trained_size]))
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, tolerance=0.45, with_encodings=True):
+        """Restore a saved index; `with_encodings=False` keeps only the partition."""
+        with np.load(path) as data:
+            n_probe, min_train, trained_size = (int(value) for value in data['params'])
+            gallery = cls(tolerance=tolerance, n_probe=n_probe, min_train=min_train)
+            if len(data['centroids']):
+                gallery.centroids = data['centroids']
+                gallery._trained_size = trained_size
+            if with_encodings:
+                live = data['card_ids'] != ''
+                gallery.add_many(data['card_ids'][live], data['encodings'][live])
+        return gallery
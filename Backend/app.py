@@ -1,58 +1,63 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room, leave_room
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, date
-from sqlalchemy import and_
+from datetime import datetime, date, timedelta, timezone
+from sqlalchemy import and_, event
 import os
-import face_recognition
+import atexit
 from dotenv import load_dotenv
 import numpy as np
-import random
 import cv2
 import platform
 import time
 import base64
+import hashlib
 import threading
+import queue
+import uuid
+import shutil
+import tempfile
+import zipfile
 from werkzeug.utils import secure_filename
 from flask import render_template
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from gallery import FaceGallery, TemplateBank
+from ann_gallery import IVFGallery
+from quantized_gallery import QUANTIZATIONS, QuantizedGallery, remove_stale_spill_files
+from encoding_store import SAMPLE_SEPARATOR, EncodingStore, card_id_from_filename
+from enrollment import (MAX_ARCHIVE_BYTES, bulk_enroll, commit_sample, encode_image_file, migrate_sample_names,
+                        sample_path, stage_images)
+from capture import CaptureThread
+from streaming import StreamHub
+from recognition import RecognitionScheduler
+from student_cache import InvalidationChannel, StudentCache
+from coalescing import ResultCoalescer
+from sightings import SightingWriter
+from cameras import CameraRegistry, parse_source
+from replay import ReplaySource
+from metrics import MetricsRegistry
+from jobs import EnrollmentJobs
+import face_models
+from ingest import ClientFrameIngest, FrameChannel
+from roster import StudentImporter, import_format, read_rows
 
 
-db = SQLAlchemy()
-def create_app():
-    app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    
-    db.init_app(app)
-    
-    with app.app_context():
-        # Clear existing models to prevent redefinition errors
-        db.reflect()
-        db.drop_all()
-        
-        # Define your models
-        class Profile(db.Model):
-            id = db.Column(db.Integer, primary_key=True)
-            institution_name = db.Column(db.String(100), nullable=False)
-            logo_filename = db.Column(db.String(100), nullable=True)
-            created_at = db.Column(db.DateTime, default=datetime.utcnow)
-        
-        # Create tables
-        db.create_all()
-    
-    return app
-
-app = create_app()
-
 load_dotenv()
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+# SOCKETIO_MESSAGE_QUEUE (e.g. redis://localhost:6379/0) lets recognition
+# workers and several web replicas emit to the same clients
+socketio = SocketIO(app, cors_allowed_origins="*",
+                    async_mode=os.getenv('SOCKETIO_ASYNC_MODE') or None,
+                    message_queue=os.getenv('SOCKETIO_MESSAGE_QUEUE') or None)
+# Recognition results and frames go out through `emitter`; a recognition
+# worker spawned without a message queue swaps in a relay to its parent
+emitter = socketio
+stream_hub = StreamHub(socketio)
 
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -78,38 +83,324 @@ class Student(db.Model):
     Remarks = db.Column(db.String(100), unique=False, nullable=False)
     Created_At = db.Column(db.DateTime, default=datetime.utcnow)
 
-class Profile(db.Model):
+class Sighting(db.Model):
+    __table_args__ = (db.Index('ix_sighting_student_seen_at', 'student_id', 'seen_at'),)
     id = db.Column(db.Integer, primary_key=True)
-    institution_name = db.Column(db.String(100), nullable=False)
-    logo_filename = db.Column(db.String(100), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-
-with app.app_context():
-    db.create_all()
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    seen_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.utcnow)
+    source = db.Column(db.String(10), nullable=False)  # 'face' or 'card'
+    camera_id = db.Column(db.String(50), nullable=True)
+    distance = db.Column(db.Float, nullable=True)
+
+class FaceEnrollment(db.Model):
+    # One row per student with face data; the primary key doubles as the
+    # index for the unassigned-cards anti-join
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    samples = db.Column(db.Integer, nullable=False, default=1)
+    enrolled_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# Filters of /api/unassigned-cards; created explicitly because create_all
+# does not add indexes to tables that already exist
+student_indexes = (db.Index('ix_student_dept_created_at', Student.Dept, Student.Created_At),
+                   db.Index('ix_student_created_at', Student.Created_At))
+
+
+# Sightings are queued and bulk-inserted off the recognition thread
+sighting_writer = SightingWriter(app, db, Sighting.__table__)
+
+camera_registry = CameraRegistry()
+atexit.register(camera_registry.stop_all)
+
+enrollment_jobs = EnrollmentJobs(lambda *args: complete_enrollment(*args),
+                                 on_finished=lambda *args: notify_enrollment(*args),
+                                 app_context=app.app_context)
+atexit.register(enrollment_jobs.shutdown)
+
+connected_clients = 0
+metrics = MetricsRegistry()
+metrics.describe('stage_seconds', 'Time spent in each capture, recognition and streaming stage')
+metrics.describe('recognition_frames_skipped', 'Captured frames the recognition loop never looked at')
+metrics.describe('results_coalesced', 'Recognition results suppressed because nothing changed')
+
+def camera_queue_depth():
+    try:
+        return camera_registry.results.qsize()
+    except NotImplementedError:
+        return 0
+
+metrics.gauge('gallery_encodings', lambda: len(gallery), 'Encodings in the face gallery')
+metrics.gauge('connected_clients', lambda: connected_clients, 'Connected SocketIO clients')
+metrics.counter('stream_frames_sent', lambda: stream_hub.frames_sent, 'Binary frames sent to stream clients')
+metrics.counter('stream_frames_dropped', lambda: stream_hub.frames_dropped, 'Frames dropped for backed-up stream clients')
+metrics.counter('capture_read_failures', lambda: camera.read_failures if camera else 0, 'Failed device reads')
+metrics.counter('capture_frames', lambda: camera.frames.seq if camera else 0, 'Frames published by the capture thread')
+metrics.gauge('sighting_queue_depth', lambda: sighting_writer.pending, 'Sightings waiting to be written')
+metrics.counter('sightings_dropped', lambda: sighting_writer.dropped, 'Sightings dropped on a full queue or failed write')
+metrics.gauge('camera_results_queue_depth', camera_queue_depth, 'Registry camera results waiting for dispatch')
+metrics.gauge('enrollment_jobs_pending', enrollment_jobs.pending, 'Enrollment jobs waiting for a worker')
+metrics.gauge('ingest_clients', lambda: frame_ingest.clients, 'Clients pushing frames')
+metrics.counter('ingest_frames_processed', lambda: frame_ingest.processed, 'Client frames run through recognition')
+metrics.counter('ingest_frames_replaced', lambda: frame_ingest.replaced,
+                'Client frames superseded before they were processed')
+metrics.counter('ingest_frames_rate_limited', lambda: frame_ingest.rate_limited,
+                'Client frames refused by the per-client rate limit')
+metrics.gauge('startup_serving_seconds', lambda: startup['serving_s'] or 0,
+              'Seconds from process start until the server was listening')
+metrics.gauge('startup_ready_seconds', lambda: startup['ready_s'] or 0,
+              'Seconds from process start until models and gallery were ready')
+metrics.counter('student_cache_hits', lambda: student_cache.hits, 'Student cache hits')
+metrics.counter('student_cache_misses', lambda: student_cache.misses, 'Student cache misses')
+
+def serialize_student(student):
+    return {
+        'Name': student.Name,
+        'Reg_No': student.Reg_No,
+        'Organization': student.Organization,
+        'Performance': student.Performance,
+        'DOB': student.DOB.strftime('%Y-%m-%d'),
+        'Blood_Group': student.Blood_Group,
+        'Phone': student.Phone,
+        'Dept': student.Dept,
+        'Gender': student.Gender,
+        'Remarks': student.Remarks
+    }
+
+def load_student_payload(card_id):
+    student = db.session.get(Student, card_id)
+    return serialize_student(student) if student else None
+
+student_cache = StudentCache(load_student_payload)
+# Set when other processes (a recognition worker, web replicas) keep their own student cache
+student_cache_channel = None
+
+def invalidate_students(card_ids):
+    for card_id in card_ids:
+        student_cache.invalidate(card_id)
+        if student_cache_channel is not None:
+            student_cache_channel.publish(card_id)
+
+def invalidate_cached_student(mapper, connection, target):
+    student_cache.invalidate(target.id)
+    # Other processes are told after the commit, or they could reload the old row
+    db.session.info.setdefault('changed_students', set()).add(target.id)
+
+def publish_changed_students(session):
+    changed = session.info.pop('changed_students', None)
+    if changed and student_cache_channel is not None:
+        for card_id in changed:
+            student_cache_channel.publish(card_id)
+
+event.listen(Student, 'after_insert', invalidate_cached_student)
+event.listen(Student, 'after_update', invalidate_cached_student)
+event.listen(Student, 'after_delete', invalidate_cached_student)
+event.listen(db.session, 'after_commit', publish_changed_students)
+event.listen(db.session, 'after_rollback', lambda session: session.info.pop('changed_students', None))
 
 images_path = "Images"
 if not os.path.exists(images_path):
     os.makedirs(images_path)
-    
-rand_id = []
-data_dict = {}
-
-for image_name in os.listdir(images_path):
-    if image_name.endswith(('.jpg', '.png', '.jpeg')):
-        card_id = os.path.splitext(image_name)[0]  
-        image_path = os.path.join(images_path, image_name)
-        image = face_recognition.load_image_file(image_path)
-        face_encodings = face_recognition.face_encodings(image)
-
-        if face_encodings:
-            if card_id not in data_dict:
-                data_dict[card_id] = []
-            data_dict[card_id].append(face_encodings[0])
-
-for key in data_dict:
-    data_dict[key] = [encoding.tolist() for encoding in data_dict[key]]
-    
+
+encoding_store = EncodingStore(os.getenv('ENCODING_STORE', 'encodings'))
+gallery_backend = os.getenv('GALLERY_BACKEND', 'exact')
+if gallery_backend == 'ivf':
+    # Approximate search for very large rosters; the trained partition is
+    # persisted, the encodings themselves always come from the store
+    ann_index_path = os.getenv('ANN_INDEX_PATH', os.path.join(encoding_store.path, 'ivf_index.npz'))
+    if os.path.exists(ann_index_path):
+        gallery = IVFGallery.load(ann_index_path, tolerance=0.45, with_encodings=False)
+    else:
+        gallery = IVFGallery(tolerance=0.45)
+    atexit.register(gallery.save, ann_index_path)
+elif gallery_backend in QUANTIZATIONS:
+    # float16/int8 codes in memory, full-precision copies for re-ranking on disk;
+    # spill files of crashed processes would otherwise pile up next to the store
+    remove_stale_spill_files(encoding_store.path)
+    gallery = QuantizedGallery(tolerance=0.45, quantization=gallery_backend,
+                               spill_path=os.path.join(encoding_store.path, f'gallery-{os.getpid()}.f32'))
+    atexit.register(gallery.close)
+    metrics.gauge('gallery_resident_bytes', gallery.memory_bytes, 'Resident size of the quantized gallery')
+else:
+    gallery = FaceGallery(tolerance=0.45)
+# Every card is matched through a fixed number of templates (mean plus a
+# few diverse samples) however many photos it was enrolled with
+template_bank = TemplateBank(gallery)
+
+app_role = None
+
+def create_app(role='all'):
+    """Initialise the database, caches and gallery for `role`, once per process.
+
+    'all' runs camera, recognition and the web server in one process (the
+    development setup). 'web' serves HTTP and SocketIO but never opens a
+    camera; 'worker' owns the camera and recognition and publishes through
+    `emitter`. See serve.py.
+    """
+    global app_role
+    if app_role is not None:
+        return app
+    app_role = role
+
+    with app.app_context():
+        db.create_all()
+        for index in student_indexes:
+            index.create(db.engine, checkfirst=True)
+    sighting_writer.start()
+    atexit.register(sighting_writer.stop)
+    if os.getenv('SOCKETIO_MESSAGE_QUEUE'):
+        # Web replicas and the worker drop each other's changed students
+        global student_cache_channel, client_frame_channel
+        student_cache_channel = InvalidationChannel(url=os.getenv('SOCKETIO_MESSAGE_QUEUE'))
+        threading.Thread(target=student_cache_channel.listen, args=(student_cache.invalidate,),
+                         name='student-cache-invalidations', daemon=True).start()
+        if role == 'web':
+            client_frame_channel = FrameChannel(url=os.getenv('SOCKETIO_MESSAGE_QUEUE'))
+        elif role == 'worker':
+            threading.Thread(target=FrameChannel(url=os.getenv('SOCKETIO_MESSAGE_QUEUE')).listen,
+                             args=(frame_ingest.submit,), name='client-frames', daemon=True).start()
+    if role == 'web':
+        # Recognition belongs to the worker; the web tier only rate-limits and forwards
+        frame_ingest.handler, frame_ingest.decode = forward_client_frame, False
+    elif role == 'worker':
+        # Already rate-limited by the web tier; queue jitter must not drop frames here
+        frame_ingest.max_fps = float('inf')
+    frame_ingest.start()
+    # Everything slow happens after the server is up; see /readyz
+    threading.Thread(target=warm_up, args=(role,), name='warm-up', daemon=True).start()
+    return app
+
+# Set once the models are loaded and the gallery is hydrated
+ready = threading.Event()
+startup = {'started_at': time.time(), 'serving_s': None, 'ready_s': None, 'stages': {}, 'error': None}
+
+def warm_models():
+    started = time.perf_counter()
+    api = face_models.load()
+    startup['stages']['model_import'] = round(time.perf_counter() - started, 3)
+    # The first detection pays for dlib's lazy initialisation
+    api.face_locations(np.zeros((64, 64, 3), dtype=np.uint8))
+    startup['stages']['models'] = round(time.perf_counter() - started, 3)
+
+def warm_up(role):
+    def timed(stage, func):
+        started = time.perf_counter()
+        func()
+        startup['stages'][stage] = round(time.perf_counter() - started, 3)
+
+    def hydrate_gallery():
+        if role == 'worker':
+            # The web tier owns the store; workers only read what it saved. The
+            # mtime is taken first, so a save racing this load is seen as a change
+            startup['manifest_mtime'] = encoding_store.manifest_mtime()
+            template_bank.load(encoding_store.entries())
+        else:
+            renamed = migrate_sample_names(images_path)
+            if renamed:
+                print(f"[DEBUG] Renamed {renamed} extra samples to <card_id>{SAMPLE_SEPARATOR}<ms>")
+            # Only new or modified images are re-encoded; the rest load from the store
+            template_bank.load(encoding_store.sync(images_path, encode_image_file))
+
+    def warm_student_cache():
+        # One query up front so the first sightings don't hit the database
+        with app.app_context():
+            student_cache.warm((student.id, serialize_student(student))
+                               for student in Student.query.yield_per(1000))
+
+    model_errors = []
+
+    def load_models():
+        try:
+            warm_models()
+        except Exception as e:
+            model_errors.append(e)
+
+    try:
+        # Model loading is mostly native code, so it overlaps with the database and store work
+        models = threading.Thread(target=load_models, name='warm-models', daemon=True)
+        models.start()
+        timed('student_cache', warm_student_cache)
+        timed('gallery', hydrate_gallery)
+        if role != 'worker':
+            # Images may have been added or deleted while the server was down
+            timed('enrollments', reconcile_enrollments)
+        models.join()
+        if model_errors:
+            raise RuntimeError(f'cannot load face models: {model_errors[0]}')
+        startup['ready_s'] = round(time.time() - startup['started_at'], 3)
+        ready.set()
+        print(f"[DEBUG] Ready {startup['ready_s']}s after start: {startup['stages']}")
+    except Exception as e:
+        startup['error'] = str(e)
+        print(f"[ERROR] Warm-up failed: {e}")
+
+def warming_up_response():
+    """A 503 for requests that need models or the gallery, or None once ready."""
+    if ready.is_set():
+        return None
+    if startup['error']:
+        return jsonify({'error': f"Server failed to start: {startup['error']}", 'status': 'failed'}), 503
+    return jsonify({'error': 'Server is warming up, try again shortly', 'status': 'warming_up',
+                    'stages': startup['stages']}), 503, {'Retry-After': '2'}
+
+@app.route('/healthz')
+def healthz():
+    # A failed warm-up never recovers on its own, so the process should be restarted
+    if startup['error']:
+        return jsonify({'status': 'failed', 'error': startup['error']}), 500
+    return jsonify({'status': 'ok', 'uptime_s': round(time.time() - startup['started_at'], 3)})
+
+@app.route('/readyz')
+def readyz():
+    payload = {
+        'status': 'ready' if ready.is_set() else 'warming_up',
+        'gallery_loaded': 'gallery' in startup['stages'],
+        'models_loaded': face_models.loaded() and 'models' in startup['stages'],
+        'encodings': len(gallery),
+        **startup,
+    }
+    if startup['error']:
+        payload['status'] = 'failed'
+    return jsonify(payload), 200 if ready.is_set() else 503
+
+def record_enrollments(card_ids):
+    """Mark `card_ids` as enrolled with their current sample counts.
+
+    Card ids that are not numeric or have no student row are skipped.
+    """
+    counts = {int(card_id): template_bank.sample_count(card_id)
+              for card_id in card_ids if str(card_id).isdigit()}
+    ids = sorted(counts)
+    with app.app_context():
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            students = {student_id for (student_id,) in
+                        db.session.query(Student.id).filter(Student.id.in_(chunk))}
+            existing = {entry.student_id: entry for entry in
+                        FaceEnrollment.query.filter(FaceEnrollment.student_id.in_(chunk))}
+            now = datetime.utcnow()
+            for student_id in chunk:
+                entry = existing.get(student_id)
+                if entry is not None:
+                    entry.samples, entry.updated_at = counts[student_id], now
+                elif student_id in students:
+                    db.session.add(FaceEnrollment(student_id=student_id, samples=counts[student_id],
+                                                  enrolled_at=now, updated_at=now))
+            db.session.commit()
+
+def reconcile_enrollments():
+    enrolled = set(template_bank.card_ids())
+    with app.app_context():
+        stale = [student_id for (student_id,) in db.session.query(FaceEnrollment.student_id)
+                 if str(student_id) not in enrolled]
+        for start in range(0, len(stale), 500):
+            FaceEnrollment.query.filter(FaceEnrollment.student_id.in_(stale[start:start + 500])).delete(
+                synchronize_session=False)
+        db.session.commit()
+    record_enrollments(enrolled)
+
+def camera_owned_by_worker():
+    return app_role == 'web'
+
 camera = None
 camera_thread = None
 stop_camera = False
@@ -156,50 +447,63 @@ def set_profile():
         'message': 'Profile created successfully',
         'logo_url': f"/static/uploads/{filename}" if filename else None
     }), 201
+def observe_capture(seconds):
+    metrics.observe('stage_seconds', seconds, stage='capture')
+
+def open_camera(options):
+    """Start capture and streaming if needed; returns False if the device won't open."""
+    global camera, camera_thread, stop_camera
+    stream_hub.settings.update(options)
+    if camera is None:
+        source = parse_source(options.get('source', 0))
+        if isinstance(source, str) and os.path.exists(source):
+            # Recorded video or frame directory, replayed through the same pipeline
+            capture = CaptureThread(source, capture=ReplaySource(
+                source, realtime=options.get('realtime', True), loop=options.get('loop', True)),
+                on_read=observe_capture)
+        else:
+            capture = CaptureThread(source, on_read=observe_capture)
+        if not capture.is_opened():
+            capture.stop()
+            return False
+        capture.start()
+        camera = capture
+        stop_camera = False
+        camera_thread = threading.Thread(target=camera_stream)
+        camera_thread.start()
+    return True
+
+def start_recognition():
+    global recognition_thread, recognition_running
+    if not recognition_running:
+        recognition_running = True
+        recognition_thread = threading.Thread(target=background_face_recognition)
+        recognition_thread.start()
+
 @app.route('/api/start-camera', methods=['POST'])
 def start_camera():
-    global camera, camera_thread, stop_camera
     try:
-        if camera is None:
-            camera = cv2.VideoCapture(0)
-            if not camera.isOpened():
-                return jsonify({'error': 'Failed to open camera'}), 500
-            stop_camera = False
-            camera_thread = threading.Thread(target=camera_stream)
-            camera_thread.start()
+        if camera_owned_by_worker():
+            return jsonify({'message': 'Camera is run by the recognition worker'}), 200
+        if not open_camera(request.get_json(silent=True) or {}):
+            return jsonify({'error': 'Failed to open camera'}), 500
         return jsonify({'message': 'Camera started successfully'}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/set-profile', methods=['POST'])
-def set_profile():
-    institution_name = request.form.get('institution_name')
-    logo = request.files.get('logo')
-
-    if not institution_name:
-        return jsonify({'error': 'Institution name is required'}), 400
-
-    filename = None
-    if logo:
-        filename = secure_filename(logo.filename)
-        logo.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-
-    profile = Profile(institution_name=institution_name, logo_filename=filename)
-    db.session.add(profile)
-    db.session.commit()
-
-    return jsonify({'message': 'Profile created successfully'}), 201
-
-
 @app.route('/api/stop-camera', methods=['POST'])
 def stop_camera_route():
     global camera, camera_thread, stop_camera
     try:
+        if camera_owned_by_worker():
+            return jsonify({'message': 'Camera is run by the recognition worker'}), 200
         if camera is not None:
             stop_camera = True
             if camera_thread is not None:
                 camera_thread.join()
-            camera.release()
+            camera.stop()
             camera = None
         return jsonify({'message': 'Camera stopped successfully'}), 200
     except Exception as e:
@@ -207,94 +511,379 @@ def stop_camera_route():
 
 def camera_stream():
     global camera, stop_camera
+    seq = 0
+    next_frame_at = time.time()
     while not stop_camera:
         if camera is not None:
-            success, frame = camera.read()
-            if success:
-                ret, buffer = cv2.imencode('.jpg', frame)
-                if ret:
-                    frame_bytes = base64.b64encode(buffer).decode('utf-8')
-                    socketio.emit('camera_frame', {'image': frame_bytes})
-        time.sleep(0.1)
+            seq, _, frame = camera.frames.wait_newer(seq, timeout=1.0)
+            if frame is not None:
+                with metrics.timer('stage_seconds', stage='stream_send'):
+                    stream_hub.send(frame, seq)
+        # Pace to the target FPS, accounting for the time spent encoding
+        next_frame_at = max(next_frame_at + 1.0 / stream_hub.settings.fps, time.time())
+        time.sleep(max(next_frame_at - time.time(), 0))
 
 recognition_thread = None
 recognition_running = False
+recognition_interval = float(os.getenv('RECOGNITION_INTERVAL', 0.1))
+camera_dispatch_thread = None
+
+def publish_recognition(faces, coalescer, camera_id=None, room=None):
+    # Only emit when faces or identities actually change
+    changed = coalescer.update(faces)
+    if not changed:
+        metrics.inc('results_coalesced')
+    for face in faces:
+        if face['card_id'] in coalescer.arrivals:
+            # Images/ may hold cards with no student row; their sightings would break the foreign key
+            if student_cache.get(face['card_id']) is not None:
+                sighting_writer.record(face['card_id'], 'face', distance=face['distance'], camera_id=camera_id)
+            coalescer.arrivals.discard(face['card_id'])
+    if not changed:
+        return
+
+    if room is None and camera_id is not None:
+        room = f'camera:{camera_id}'
+    if not faces:
+        print("[DEBUG] No face detected")
+        emitter.emit('face_recognition_result', {
+            'camera_id': camera_id,
+            'face_detected': False,
+            'identified': False,
+            'student_name': None,
+            'student': None,  # Explicitly set student to None
+            'faces': []
+        }, to=room)
+        return
+
+    # Every face in the frame was encoded and matched in one batch
+    with metrics.timer('stage_seconds', stage='lookup'):
+        for face in faces:
+            face['student'] = student_cache.get(face['card_id']) if face['confirmed'] else None
+            face['identified'] = face['student'] is not None
+
+    identified = [face for face in faces if face['identified']]
+    if not identified:
+        print("[DEBUG] Face detected but not identified")
+    # Top-level fields describe the first identified face for single-face clients
+    emit_started = time.perf_counter()
+    emitter.emit('face_recognition_result', {
+        'camera_id': camera_id,
+        'face_detected': True,
+        'identified': bool(identified),
+        'student_name': identified[0]['student']['Name'] if identified else None,
+        'student': identified[0]['student'] if identified else None,
+        'faces': faces
+    }, to=room)
+    metrics.observe('stage_seconds', time.perf_counter() - emit_started, stage='emit')
+
+def track_faces(tracks):
+    faces = []
+    for track in tracks:
+        top, right, bottom, left = track.box
+        faces.append({
+            'track_id': track.track_id,
+            'box': {'top': top, 'right': right, 'bottom': bottom, 'left': left},
+            'card_id': track.card_id,
+            'distance': track.distance,
+            'encoded_at': track.encoded_at,
+            'live': track.live
+        })
+    return faces
 
 def background_face_recognition():
     global camera, recognition_running
 
     print("[DEBUG] Face recognition thread started")
+    while recognition_running and not ready.wait(timeout=1.0):
+        pass
 
+    seq = 0
+    recognizer = RecognitionScheduler(gallery)
+    coalescer = ResultCoalescer()
     with app.app_context():
         while recognition_running:
             try:
-                # ... [previous code remains the same] ...
-
-                if not face_encodings:
-                    print("[DEBUG] No face detected")
-                    socketio.emit('face_recognition_result', {
-                        'face_detected': False,
-                        'identified': False,
-                        'student_name': None,
-                        'student': None  # Explicitly set student to None
-                    })
-                    continue  
-                else:
-                    unknown_encoding = face_encodings[0]
-                    identified = False
-                    matched_name = None
-
-                    for card_id, encodings in data_dict.items():
-                        known_encodings = [np.array(enc) for enc in encodings]
-                        results = face_recognition.compare_faces(known_encodings, unknown_encoding, tolerance=0.45)
-                        if True in results:
-                            identified = True
-                            student = Student.query.filter_by(id=int(card_id)).first()
-                            if student:
-                                matched_name = student.Name
-                                # Send all student details
-                                socketio.emit('face_recognition_result', {
-                                    'face_detected': True,  # Fixed typo (was 'face_dected')
-                                    'identified': True,
-                                    'student': {
-                                        'Name': student.Name,
-                                        'Reg_No': student.Reg_No,
-                                        'Organization': student.Organization,
-                                        'Performance': student.Performance,
-                                        'DOB': student.DOB.strftime('%Y-%m-%d'),
-                                        'Blood_Group': student.Blood_Group,
-                                        'Phone': student.Phone,
-                                        'Dept': student.Dept,
-                                        'Gender': student.Gender,
-                                        'Remarks': student.Remarks
-                                    }
-                                })
-                            break
-
-                    if not identified:
-                        print("[DEBUG] Face detected but not identified")
-                        socketio.emit('face_recognition_result', {
-                            'face_detected': True,
-                            'identified': False,
-                            'student_name': None
-                        })
+                if camera is None:
+                    time.sleep(1/3)
+                    continue
+                # Skip straight to the newest frame instead of reading the device
+                previous_seq = seq
+                seq, captured_at, frame = camera.frames.wait_newer(seq, timeout=1.0)
+                if frame is None:
+                    continue
+                if previous_seq and seq - previous_seq > 1:
+                    metrics.inc('recognition_frames_skipped', seq - previous_seq - 1)
+                metrics.observe('stage_seconds', time.time() - captured_at, stage='frame_age')
+
+                # Full detect + encode only on keyframes; tracked faces keep their identity
+                started = time.perf_counter()
+                tracks = recognizer.process(frame)
+                for stage, seconds in recognizer.stage_times.items():
+                    metrics.observe('stage_seconds', seconds, stage=stage)
+                metrics.observe('stage_seconds', time.perf_counter() - started, stage='recognition_total')
+
+                publish_recognition(track_faces(tracks), coalescer)
 
             except Exception as e:
                 print(f"[ERROR] Exception in recognition thread: {e}")
 
-            time.sleep(1/3)  # Process ~3 times per second
+            time.sleep(recognition_interval)
+
+def dispatch_camera_results():
+    # Registry workers only detect and encode; matching against the shared
+    # gallery happens here so every camera sees the same enrollments.
+    states = {}
+    with app.app_context():
+        while True:
+            try:
+                message = camera_registry.results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                camera_id = message['camera_id']
+                if 'error' in message:
+                    print(f"[ERROR] Camera {camera_id}: {message['error']}")
+                    emitter.emit('camera_error', message, to=f'camera:{camera_id}')
+                    continue
+                if camera_id not in camera_registry:
+                    states.pop(camera_id, None)
+                    continue
+
+                state = states.setdefault(camera_id, {'identities': {}, 'coalescer': ResultCoalescer()})
+                identities = state['identities']
+                fresh = [face for face in message['faces'] if face['encoding'] is not None]
+                if fresh:
+                    matches = gallery.match_batch([face['encoding'] for face in fresh])
+                    for face, (card_id, distance) in zip(fresh, matches):
+                        identities.pop(face['track_id'], None)
+                        identities[face['track_id']] = (card_id, distance, face['encoded_seq'])
+                while len(identities) > 256:
+                    identities.pop(next(iter(identities)))
+
+                faces = []
+                for face in message['faces']:
+                    top, right, bottom, left = face['box']
+                    card_id, distance, encoded_at = identities.get(face['track_id'], (None, None, None))
+                    faces.append({
+                        'track_id': face['track_id'],
+                        'box': {'top': top, 'right': right, 'bottom': bottom, 'left': left},
+                        'card_id': card_id,
+                        'distance': distance,
+                        'encoded_at': encoded_at
+                    })
+                publish_recognition(faces, state['coalescer'], camera_id=camera_id)
+            except Exception as e:
+                print(f"[ERROR] Exception in camera dispatcher: {e}")
+
+def add_registry_camera(source, camera_id=None, name=None):
+    global camera_dispatch_thread
+    if camera_dispatch_thread is None:
+        camera_dispatch_thread = threading.Thread(target=dispatch_camera_results, daemon=True)
+        camera_dispatch_thread.start()
+    return camera_registry.add(source, camera_id=camera_id, name=name)
+
+def recognize_client_frame(client, frame):
+    # Each client keeps its own tracker and coalescer, like a camera would
+    if not client.state:
+        client.state['recognizer'] = RecognitionScheduler(gallery)
+        client.state['coalescer'] = ResultCoalescer()
+    recognizer = client.state['recognizer']
+    started = time.perf_counter()
+    tracks = recognizer.process(frame)
+    for stage, seconds in recognizer.stage_times.items():
+        metrics.observe('stage_seconds', seconds, stage=stage)
+    metrics.observe('stage_seconds', time.perf_counter() - started, stage='client_recognition_total')
+
+    faces = track_faces(tracks)
+    with app.app_context():
+        publish_recognition(faces, client.state['coalescer'], camera_id=client.client_id, room=client.room)
+    return {'faces': faces}
+
+def forward_client_frame(client, jpeg):
+    if client_frame_channel is None or not client_frame_channel.publish(client.client_id, jpeg, client.room):
+        return {'error': 'The recognition worker is not accepting frames'}
+    # Faces arrive in the client's room once the worker has processed the frame
+    return {'forwarded': True}
+
+# Frames pushed by glasses and browsers; latest frame only, rate-limited per client
+frame_ingest = ClientFrameIngest(recognize_client_frame)
+# Set in the web role, where frames are recognised by the worker
+client_frame_channel = None
+
+def client_token_id(token):
+    """Stable id for the device holding `token`; the token itself is never echoed."""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+def decode_frame_payload(data):
+    """JPEG bytes from a binary payload, a {'image': ...} dict or a data URL."""
+    if isinstance(data, dict):
+        data = data.get('image')
+    if isinstance(data, str):
+        data = base64.b64decode(data.split('base64,')[-1])
+    return data if isinstance(data, (bytes, bytearray)) else None
+
+@app.route('/api/frames', methods=['POST'])
+def submit_frame_http():
+    warming_up = warming_up_response()
+    if warming_up:
+        return warming_up
+    # The device's secret token is its identity; results go only to the room
+    # derived from it, which viewers holding the same token join with `join_client`
+    token = request.headers.get('X-Client-Token', '')
+    if not 16 <= len(token) <= 128:
+        return jsonify({'error': 'An X-Client-Token header of 16 to 128 characters is required'}), 400
+    client_id = client_token_id(token)
+    frame = request.files.get('frame')
+    jpeg = frame.read() if frame else request.get_data()
+    if not jpeg:
+        return jsonify({'error': 'A JPEG frame is required'}), 400
+
+    status, seq = frame_ingest.submit(client_id, jpeg, room=f'client:{client_id}')
+    if status == 'too_large':
+        return jsonify({'error': 'Frame is too large'}), 413
+    if status == 'rate_limited':
+        retry_after = frame_ingest.retry_after(client_id)
+        return jsonify({'error': 'Too many frames', 'retry_after': round(retry_after, 3)}), 429, \
+            {'Retry-After': str(max(int(retry_after + 0.999), 1))}
+    if request.args.get('wait', '').lower() in ('1', 'true'):
+        result = frame_ingest.wait_result(client_id, seq)
+        if result is not None:
+            return jsonify({'status': status, 'seq': seq, **result}), 200
+    return jsonify({'status': status, 'seq': seq}), 202
+
+@socketio.on('submit_frame')
+def handle_submit_frame(data):
+    jpeg = decode_frame_payload(data)
+    if jpeg is None:
+        return {'status': 'error', 'error': 'Expected a binary JPEG frame'}
+    if not ready.is_set():
+        return {'status': 'warming_up', 'stages': startup['stages']}
+    # The sid is also the client's private room, so nobody else sees its results
+    status, seq = frame_ingest.submit(request.sid, jpeg, room=request.sid)
+    return {'status': status, 'seq': seq}
+
+@socketio.on('join_client')
+def handle_join_client(data):
+    """Receive the results of the HTTP client whose token this socket presents."""
+    token = str((data or {}).get('token') or '')
+    if not 16 <= len(token) <= 128:
+        return {'status': 'error', 'error': 'A token of 16 to 128 characters is required'}
+    join_room(f'client:{client_token_id(token)}')
+    return {'status': 'joined'}
+
+@app.route('/api/cameras', methods=['GET'])
+def list_cameras():
+    return jsonify(camera_registry.list())
+
+@app.route('/api/cameras', methods=['POST'])
+def add_camera():
+    warming_up = warming_up_response()
+    if warming_up:
+        return warming_up
+    if camera_owned_by_worker():
+        return jsonify({'error': 'Cameras are run by the recognition worker; set CAMERA_SOURCES there'}), 409
+    data = request.get_json(silent=True) or {}
+    source = data.get('source')
+    if source is None or source == '':
+        return jsonify({'error': 'Camera source is required (device index, file path or RTSP URL)'}), 400
+    try:
+        camera_info = add_registry_camera(source, camera_id=data.get('camera_id'), name=data.get('name'))
+        return jsonify(camera_info), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cameras/<camera_id>', methods=['DELETE'])
+def remove_camera(camera_id):
+    if not camera_registry.remove(camera_id):
+        return jsonify({'error': 'Camera not found'}), 404
+    return jsonify({'message': 'Camera removed successfully'}), 200
+
+@socketio.on('join_camera')
+def handle_join_camera(data):
+    join_room(f"camera:{data.get('camera_id')}")
+
+@socketio.on('leave_camera')
+def handle_leave_camera(data):
+    leave_room(f"camera:{data.get('camera_id')}")
+
+STUDENT_FIELDS = ('id', 'Name', 'Reg_No', 'DOB', 'Blood_Group', 'Phone', 'Dept', 'Gender',
+                  'Organization', 'Performance', 'Remarks', 'Created_At')
+
+@app.route('/api/students', methods=['GET'])
+def list_students():
+    """Keyset-paginated roster: pass the previous page's `next_after` as `after`."""
+    try:
+        fields = [field for field in request.args.get('fields', 'id,Name,Reg_No,Dept').split(',') if field]
+        unknown = [field for field in fields if field not in STUDENT_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        if 'id' not in fields:
+            fields.insert(0, 'id')
+        limit = request.args.get('limit', '100')
+        if not limit.isdigit() or not 1 <= int(limit) <= 1000:
+            return jsonify({'error': 'limit must be an integer from 1 to 1000'}), 400
+        limit = int(limit)
+        after = request.args.get('after')
+        if after is not None and not after.lstrip('-').isdigit():
+            return jsonify({'error': 'after must be an integer student id'}), 400
+
+        query = db.session.query(*(getattr(Student, field) for field in fields))
+        if after is not None:
+            query = query.filter(Student.id > int(after))
+        if request.args.get('dept'):
+            query = query.filter(Student.Dept == request.args['dept'])
+        rows = query.order_by(Student.id).limit(limit).all()
+
+        items = []
+        for row in rows:
+            item = dict(zip(fields, row))
+            for field in ('DOB', 'Created_At'):
+                if item.get(field) is not None:
+                    item[field] = item[field].isoformat()
+            items.append(item)
+        return jsonify({
+            'items': items,
+            'next_after': items[-1]['id'] if len(items) == limit else None
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def students_imported(rows):
+    # Imported ids may sit in the cache as unknown, and may already have face data
+    reg_nos = [row['Reg_No'] for row in rows]
+    with app.app_context():
+        students = Student.query.filter(Student.Reg_No.in_(reg_nos)).all()
+        # Bulk inserts skip the ORM events, so other processes are told here
+        invalidate_students(student.id for student in students)
+        for student in students:
+            student_cache.put(student.id, serialize_student(student))
+        record_enrollments(student.id for student in students if str(student.id) in gallery)
+
+@app.route('/api/students/import', methods=['POST'])
+def import_students():
+    try:
+        upload = request.files.get('file')
+        fmt = import_format(upload.filename if upload else None,
+                            request.args.get('format') or ('jsonl' if request.mimetype == 'application/x-ndjson'
+                                                           else 'csv' if request.mimetype == 'text/csv' else None))
+        stream = upload.stream if upload else request.stream
+        importer = StudentImporter(db.engine, Student.__table__, on_inserted=students_imported)
+        started = time.perf_counter()
+        summary = importer.run(read_rows(stream, fmt))
+        summary['elapsed_s'] = round(time.perf_counter() - started, 3)
+        return jsonify(summary), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/students', methods=['POST'])
 def add_student():
     data = request.json
     try:
-        new_num = None
-        while True:
-            new_num = random.randint(10**9, 10**10-1)
-            if new_num not in rand_id:
-                rand_id.append(new_num)
-                break
-        
         student = Student(
             Name=data['Name'].upper(),
             Reg_No=data['Reg_No'],
@@ -311,6 +900,9 @@ def add_student():
 
         db.session.add(student)
         db.session.commit()
+        student_cache.put(student.id, serialize_student(student))
+        if str(student.id) in gallery:
+            record_enrollments([student.id])
         return jsonify({
             'message': 'Student added successfully',
             'student': {
@@ -334,23 +926,14 @@ def add_student():
 @socketio.on('scan_card')
 def handle_card_scan(data):
     card_id = data.get('card_id')
-    student = Student.query.filter_by(Card_Id=card_id).first()
+    student = student_cache.get(card_id)
 
     if student:
+        sighting_writer.record(card_id, 'card')
         socketio.emit('face_recognition_result', {
             'face_detected': True,
             'identified': True,
-            'student': {
-                'Name': student.Name,
-                'Reg_No': student.Reg_No,
-                'DOB': student.DOB.strftime('%Y-%m-%d'),
-                'Blood_Group': student.Blood_Group,
-                'Phone': student.Phone,
-                'Dept': student.Dept,
-                'Gender': student.Gender,
-                'Organization': student.Organization,  
-                'Remarks': student.Remarks
-            }
+            'student': student
         })
 
     else:
@@ -359,22 +942,107 @@ def handle_card_scan(data):
             'message': 'Card not found!'
         })
 
+def serialize_sighting(sighting, name=None):
+    return {
+        'student_id': sighting.student_id,
+        'Name': name,
+        'seen_at': sighting.seen_at.replace(tzinfo=timezone.utc).isoformat(),
+        'source': sighting.source,
+        'camera_id': sighting.camera_id,
+        'distance': sighting.distance
+    }
+
+def local_day_start(day):
+    """UTC (naive, like Sighting.seen_at) of local midnight at the start of `day`."""
+    return datetime.combine(day, datetime.min.time()).astimezone(timezone.utc).replace(tzinfo=None)
+
+def paginated_sightings(query):
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 50, type=int), 500)
+    result = query.order_by(Sighting.seen_at, Sighting.id).paginate(page=page, per_page=per_page, error_out=False)
+    return jsonify({
+        'items': [serialize_sighting(sighting, name) for sighting, name in result.items],
+        'page': result.page,
+        'per_page': result.per_page,
+        'total': result.total,
+        'pages': result.pages
+    })
+
+@app.route('/api/attendance', methods=['GET'])
+def get_attendance():
+    try:
+        # Days are local; sightings are stored in UTC
+        day = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if 'date' in request.args else date.today()
+        query = (db.session.query(Sighting, Student.Name)
+                 .join(Student, Student.id == Sighting.student_id)
+                 .filter(Sighting.seen_at >= local_day_start(day),
+                         Sighting.seen_at < local_day_start(day + timedelta(days=1))))
+        if request.args.get('source'):
+            query = query.filter(Sighting.source == request.args['source'])
+        return paginated_sightings(query)
+    except ValueError:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/students/<int:student_id>/attendance', methods=['GET'])
+def get_student_attendance(student_id):
+    try:
+        query = (db.session.query(Sighting, Student.Name)
+                 .join(Student, Student.id == Sighting.student_id)
+                 .filter(Sighting.student_id == student_id))
+        if request.args.get('from'):
+            query = query.filter(Sighting.seen_at >= local_day_start(
+                datetime.strptime(request.args['from'], '%Y-%m-%d').date()))
+        if request.args.get('to'):
+            query = query.filter(Sighting.seen_at < local_day_start(
+                datetime.strptime(request.args['to'], '%Y-%m-%d').date() + timedelta(days=1)))
+        return paginated_sightings(query)
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/unassigned-cards', methods=['GET'])
 def get_unassigned_cards():
+    warming_up = warming_up_response()
+    if warming_up:
+        return warming_up
     try:
-        assigned_cards = {int(os.path.splitext(f)[0]) for f in os.listdir(images_path) 
-                       if f.endswith(('.jpg', '.png', '.jpeg'))}
-        all_students = Student.query.all()
-        unassigned_cards = [student.id for student in all_students 
-                          if student.id not in assigned_cards]
-        print(f"Unassigned cards: {unassigned_cards}")  # Debug log
-        return jsonify(unassigned_cards)
+        # Students without a FaceEnrollment row, found through its primary key
+        query = (db.session.query(Student.id, Student.Name, Student.Dept, Student.Created_At)
+                 .outerjoin(FaceEnrollment, FaceEnrollment.student_id == Student.id)
+                 .filter(FaceEnrollment.student_id.is_(None)))
+        if request.args.get('dept'):
+            query = query.filter(Student.Dept == request.args['dept'])
+        if request.args.get('created_from'):
+            query = query.filter(Student.Created_At >= datetime.strptime(request.args['created_from'], '%Y-%m-%d'))
+        if request.args.get('created_to'):
+            query = query.filter(Student.Created_At < datetime.strptime(request.args['created_to'], '%Y-%m-%d') + timedelta(days=1))
+
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 100, type=int), 1000)
+        result = query.order_by(Student.id).paginate(page=page, per_page=per_page, error_out=False)
+        return jsonify({
+            'items': [{'id': student_id, 'Name': name, 'Dept': dept,
+                       'Created_At': created_at.isoformat() if created_at else None}
+                      for student_id, name, dept, created_at in result.items],
+            'page': result.page,
+            'per_page': result.per_page,
+            'total': result.total,
+            'pages': result.pages
+        })
+    except ValueError:
+        return jsonify({'error': 'created_from and created_to must be YYYY-MM-DD'}), 400
     except Exception as e:
         print(f"Error in get_unassigned_cards: {str(e)}")
         return jsonify({'error': str(e)}), 500
 @app.route('/api/capture-image', methods=['POST'])
 def capture_image():
     global camera
+    warming_up = warming_up_response()
+    if warming_up:
+        return warming_up
     try:
         data = request.json
         card_id = data.get('card_id')
@@ -385,47 +1053,40 @@ def capture_image():
         if camera is None:
             return jsonify({'error': 'Camera is not started'}), 400
             
-        success, frame = camera.read()
-        if not success:
+        _, _, frame = camera.frames.latest()
+        if frame is None:
             return jsonify({'error': 'Failed to capture image'}), 500
 
-        image_path = os.path.join(images_path, f"{card_id}.jpg")
-        cv2.imwrite(image_path, frame)
-        camera.release()
-
-        image = face_recognition.load_image_file(image_path)
-        face_encodings = face_recognition.face_encodings(image)
-        
-        if face_encodings:
-            if card_id not in data_dict:
-                data_dict[card_id] = []
-            data_dict[card_id].append(face_encodings[0].tolist())
-            socketio.emit('image_captured', {'success': True})
-            return jsonify({'message': 'Image captured and saved successfully'}), 200
-        else:
-            os.remove(image_path) 
-            return jsonify({'error': 'No face detected in the captured image'}), 400
+        # The ring buffer slot gets reused, so the job keeps its own copy
+        frame = frame.copy()
+        job = enrollment_jobs.submit(card_id, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB),
+                                     context={'kind': 'capture', 'frame': frame})
+        return jsonify({'message': 'Image captured, enrollment queued', **job}), 202
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
 @socketio.on('perform_face_recognition')
 def handle_face_recognition_trigger():
-    global recognition_thread, recognition_running
-
-    if not recognition_running:
-        recognition_running = True
-        recognition_thread = threading.Thread(target=background_face_recognition)
-        recognition_thread.start()
+    # A recognition worker runs continuously; there is nothing to start here
+    if not camera_owned_by_worker():
+        if not ready.is_set():
+            # The thread starts now and begins matching as soon as warm-up ends
+            socketio.emit('warming_up', {'stages': startup['stages']}, to=request.sid)
+        start_recognition()
 
 @socketio.on('stop_face_recognition')
 def stop_face_recognition():
     global recognition_running
-    recognition_running = False
+    if not camera_owned_by_worker():
+        recognition_running = False
 
 
 @app.route('/api/assign-image', methods=['POST'])
 def assign_image():
+    warming_up = warming_up_response()
+    if warming_up:
+        return warming_up
     try:
         data = request.json
         card_id = data.get('card_id')
@@ -439,168 +1100,188 @@ def assign_image():
 
         image_bytes = base64.b64decode(image_data)
 
-        image_path = os.path.join(images_path, f"{card_id}.jpg")
-        with open(image_path, 'wb') as f:
-            f.write(image_bytes)
+        # Decoded and encoded in memory by the job pool; the file is only written once a face is found
+        job = enrollment_jobs.submit(card_id, image_bytes, context={'kind': 'assign', 'bytes': image_bytes})
+        return jsonify({'message': 'Image received, enrollment queued', **job}), 202
 
-        image = face_recognition.load_image_file(image_path)
-        face_encodings = face_recognition.face_encodings(image)
-        
-        if face_encodings:
-            if card_id not in data_dict:
-                data_dict[card_id] = []
-            data_dict[card_id].append(face_encodings[0].tolist())
-            return jsonify({'message': 'Image assigned successfully'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/enrollment-jobs/<job_id>', methods=['GET'])
+def get_enrollment_job(job_id):
+    job = enrollment_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+def complete_enrollment(job, result, context):
+    if not result['success']:
+        return result['error']
+    card_id = job['card_id']
+    image_path = enrollment_sample_path(card_id)
+    if context['kind'] == 'capture':
+        cv2.imwrite(image_path, context['frame'])
+    else:
+        with open(image_path, 'wb') as f:
+            f.write(context['bytes'])
+    template_bank.enroll(card_id, result['encoding'])
+    encoding_store.put(image_path, card_id, result['encoding'])
+    record_enrollments([card_id])
+    return None
+
+def enrollment_sample_path(card_id, ext='.jpg'):
+    """Path for a new photo of `card_id`, keeping earlier samples.
+
+    The first photo is `<card_id>.jpg`; re-enrollments add
+    `<card_id>@<ms>.jpg`, and the oldest extra samples beyond the template
+    bank's limit are deleted.
+    """
+    samples = sorted(f for f in os.listdir(images_path)
+                     if f.startswith(f"{card_id}{SAMPLE_SEPARATOR}") and card_id_from_filename(f) == str(card_id))
+    for stale in samples[:max(len(samples) - template_bank.max_samples + 2, 0)]:
+        os.remove(os.path.join(images_path, stale))
+        encoding_store.discard(stale)
+    return sample_path(images_path, card_id, ext)
+
+def enrollment_job_room(job_id):
+    return f'enrollment:{job_id}'
+
+def notify_enrollment(job, context, to=None):
+    # Only sockets that asked to watch this job hear how it ended
+    to = to or enrollment_job_room(job['job_id'])
+    socketio.emit('enrollment_job', job, to=to)
+    if job['kind'] == 'capture' and job['status'] == 'done':
+        socketio.emit('image_captured', {'success': True, 'card_id': job['card_id']}, to=to)
+
+@socketio.on('watch_enrollment_job')
+def handle_watch_enrollment_job(data):
+    """Subscribe this socket to a job id returned by an enrollment request."""
+    job_id = str((data or {}).get('job_id'))
+    # Joined before looking, so a job finishing in between is not missed
+    join_room(enrollment_job_room(job_id))
+    job = enrollment_jobs.get(job_id)
+    if job is None:
+        leave_room(enrollment_job_room(job_id))
+        socketio.emit('enrollment_job', {'job_id': job_id, 'status': 'unknown'}, to=request.sid)
+        return
+    if job['status'] in ('done', 'failed'):
+        # It finished before the socket asked; nothing further will be sent to the room
+        notify_enrollment(job, None, to=request.sid)
+
+def run_bulk_enroll(job_id, staging_path, image_paths, failures):
+    enrolled = []
+
+    def on_result(result, summary):
+        if result['success']:
+            # Moved out of staging only now, next to any photos the card already has
+            image_path = commit_sample(result['path'], enrollment_sample_path(
+                result['card_id'], os.path.splitext(result['path'])[1]))
+            template_bank.enroll(result['card_id'], result['encoding'])
+            enrolled.append((image_path, result['card_id'], result['encoding']))
+            if len(enrolled) >= 64:
+                encoding_store.put_many(enrolled)
+                record_enrollments(card_id for _, card_id, _ in enrolled)
+                enrolled.clear()
         else:
-            os.remove(image_path)
-            return jsonify({'error': 'No face detected in the image'}), 400
+            print(f"[DEBUG] Bulk enroll {job_id}: {result['file']}: {result['error']}")
+        socketio.emit('bulk_enroll_progress', {
+            'job_id': job_id,
+            'file': result['file'],
+            'card_id': result['card_id'],
+            'success': result['success'],
+            'error': result['error'],
+            'quality': result.get('quality'),
+            'done': summary['enrolled'] + summary['failed'],
+            'total': summary['total']
+        })
 
+    try:
+        summary = bulk_enroll(image_paths, on_result)
+        summary['failed'] += len(failures)
+    except Exception as e:
+        print(f"[ERROR] Bulk enroll {job_id} failed: {e}")
+        summary = {'error': str(e)}
+    finally:
+        # Photos already moved into Images/ reach the store even if the batch died part way
+        if enrolled:
+            encoding_store.put_many(enrolled)
+            record_enrollments(card_id for _, card_id, _ in enrolled)
+        shutil.rmtree(staging_path, ignore_errors=True)
+    socketio.emit('bulk_enroll_complete', {'job_id': job_id, **summary, 'skipped': failures})
+
+@app.route('/api/bulk-enroll', methods=['POST'])
+def bulk_enroll_route():
+    warming_up = warming_up_response()
+    if warming_up:
+        return warming_up
+    staging_path = None
+    try:
+        # Checked before request.files, which would spool the whole body to disk first
+        if request.content_length is None:
+            return jsonify({'error': 'A Content-Length header is required'}), 411
+        if request.content_length > MAX_ARCHIVE_BYTES:
+            return jsonify({'error': 'Archive is too large'}), 413
+        archive = request.files.get('archive')
+        if not archive:
+            return jsonify({'error': 'A zip archive of <card_id>.jpg photos is required'}), 400
+
+        staging_path = tempfile.mkdtemp(prefix='bulk-enroll-')
+        image_paths, failures = stage_images(archive.stream, staging_path)
+        job_id = uuid.uuid4().hex
+        threading.Thread(target=run_bulk_enroll, args=(job_id, staging_path, image_paths, failures),
+                         daemon=True).start()
+        staging_path = None  # the job cleans up from here
+        return jsonify({
+            'message': 'Bulk enrollment started',
+            'job_id': job_id,
+            'total': len(image_paths),
+            'skipped': failures
+        }), 202
+    except zipfile.BadZipFile:
+        return jsonify({'error': 'Uploaded file is not a valid zip archive'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 413
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    finally:
+        if staging_path is not None:
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 @socketio.on('connect')
 def handle_connect():
+    global connected_clients
+    connected_clients += 1
+    # Every client gets base64 frames until it asks for binary ones
+    stream_hub.connect(request.sid)
+    join_room(StreamHub.LEGACY_ROOM)
     print('Client connected')
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    global connected_clients
+    connected_clients = max(connected_clients - 1, 0)
+    stream_hub.unsubscribe(request.sid)
+    frame_ingest.remove(request.sid)
     print('Client disconnected')
 
-if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-    socketio.run(app, host='0.0.0.0', debug=True, port=5000)
-    
-# EDITED 
-from flask import Flask, request, jsonify, render_template
-from flask_cors import CORS
-from flask_socketio import SocketIO
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, date
-from sqlalchemy import and_
-import os
-import face_recognition
-from dotenv import load_dotenv
-import numpy as np
-import random
-import cv2
-import platform
-import time
-import base64
-import threading
-from werkzeug.utils import secure_filename
-
-# Load environment variables first
-load_dotenv()
-
-# Initialize extensions
-db = SQLAlchemy()
-socketio = SocketIO()
-
-def create_app():
-    app = Flask(__name__)
-    
-    # Configuration
-    app.config['UPLOAD_FOLDER'] = 'static/uploads'
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///app.db')  # Default to SQLite if not set
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    
-    # Initialize extensions with app
-    CORS(app)
-    db.init_app(app)
-    socketio.init_app(app, cors_allowed_origins="*")
-    
-    # Define models
-    class Profile(db.Model):
-        id = db.Column(db.Integer, primary_key=True)
-        institution_name = db.Column(db.String(100), nullable=False)
-        logo_filename = db.Column(db.String(100), nullable=True)
-        created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-    class Student(db.Model):
-        id = db.Column(db.Integer, primary_key=True)
-        Name = db.Column(db.String(20), nullable=False)
-        Reg_No = db.Column(db.String(10), unique=True, nullable=False)
-        DOB = db.Column(db.Date, nullable=False)
-        Blood_Group = db.Column(db.String(5), nullable=False)
-        Phone = db.Column(db.String(10), unique=True, nullable=False)
-        Dept = db.Column(db.String(10), nullable=False)
-        Gender = db.Column(db.String(10), nullable=False)
-        Organization = db.Column(db.String(100), nullable=True)
-        Performance = db.Column(db.String(100), nullable=True)
-        Remarks = db.Column(db.String(100), nullable=False)
-        Created_At = db.Column(db.DateTime, default=datetime.utcnow)
-
-    # Create database tables
-    with app.app_context():
-        db.create_all()
-        
-        # Initialize face recognition data
-        images_path = "Images"
-        if not os.path.exists(images_path):
-            os.makedirs(images_path)
-            
-        rand_id = []
-        data_dict = {}
-
-        for image_name in os.listdir(images_path):
-            if image_name.endswith(('.jpg', '.png', '.jpeg')):
-                card_id = os.path.splitext(image_name)[0]  
-                image_path = os.path.join(images_path, image_name)
-                image = face_recognition.load_image_file(image_path)
-                face_encodings = face_recognition.face_encodings(image)
-
-                if face_encodings:
-                    if card_id not in data_dict:
-                        data_dict[card_id] = []
-                    data_dict[card_id].append(face_encodings[0])
-
-        for key in data_dict:
-            data_dict[key] = [encoding.tolist() for encoding in data_dict[key]]
-
-    # Global variables for camera
-    camera = None
-    camera_thread = None
-    stop_camera = False
-    recognition_thread = None
-    recognition_running = False
-
-    # Import routes after app is created to avoid circular imports
-    from . import routes
-    app.register_blueprint(routes.bp)
-
-    return app
-
-app = create_app()
-
-# Routes
-@app.route('/')
-def home():
-    print("[DEBUG] Home page loaded")
-    return render_template('home.html')
-
-@app.route('/api/get-profile')
-def get_profile():
-    profile = Profile.query.order_by(Profile.created_at.desc()).first()
-    if not profile:
-        return jsonify({
-            'institution_name': 'Default Institution',
-            'logo_url': None
-        })
-    return jsonify({
-        'institution_name': profile.institution_name,
-        'logo_url': f"/static/uploads/{profile.logo_filename}" if profile.logo_filename else None
-    })
-
-# ... (keep all your other route definitions as they are)
+@socketio.on('stream_options')
+def handle_stream_options(data):
+    data = data or {}
+    binary = bool(data.get('binary', True))
+    stream_hub.subscribe(request.sid, binary=binary)
+    # The rooms reach clients of this process when frames come from a worker through the message queue
+    leave_room(StreamHub.LEGACY_ROOM if binary else StreamHub.BINARY_ROOM)
+    join_room(StreamHub.BINARY_ROOM if binary else StreamHub.LEGACY_ROOM)
+    return stream_hub.settings.as_dict()
 
 if __name__ == '__main__':
-    # Ensure the upload folder exists
-    if not os.path.exists(app.config['UPLOAD_FOLDER']):
-        os.makedirs(app.config['UPLOAD_FOLDER'])
-    
-    # Ensure the images folder exists
-    if not os.path.exists("Images"):
-        os.makedirs("Images")
-    
-    socketio.run(app, host='0.0.0.0', debug=True, port=5000)
\ No newline at end of file
+    # Development server; use serve.py in production. The reloader would
+    # import the module, and so build the app, a second time.
+    create_app()
+    startup['serving_s'] = round(time.time() - startup['started_at'], 3)
+    socketio.run(app, host='0.0.0.0', debug=True, use_reloader=False, port=5000)
+
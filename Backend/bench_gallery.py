@@ -0,0 +1,79 @@
+"""Compare the IVF gallery against exact search on synthetic rosters.
+
+    python bench_gallery.py --sizes 1000 10000 100000 --probes 1 4 8 16
+
+Identities are random unit-scale 128-d vectors; queries are noisy copies
+of enrolled identities, roughly matching same-person distances of real
+face encodings (~0.35). recall@1 is the fraction of queries for which the
+IVF gallery returns the same nearest identity as exact search.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from ann_gallery import IVFGallery
+from gallery import ENCODING_SIZE, FaceGallery
+
+
+def synthetic_roster(size, queries, noise, seed):
+    rng = np.random.default_rng(seed)
+    identities = rng.normal(scale=1 / np.sqrt(ENCODING_SIZE), size=(size, ENCODING_SIZE)).astype(np.float32)
+    expected = rng.integers(0, size, queries)
+    probes = identities[expected] + rng.normal(scale=noise, size=(queries, ENCODING_SIZE)).astype(np.float32)
+    return identities, probes
+
+
+def timed_queries(gallery, probes, **kwargs):
+    results = []
+    started = time.perf_counter()
+    for probe in probes:
+        results.append(gallery.match_batch([probe], tolerance=float('inf'), **kwargs)[0][0])
+    return results, (time.perf_counter() - started) / len(probes) * 1000.0
+
+
+def benchmark(size, probe_counts, queries, noise, seed):
+    identities, probes = synthetic_roster(size, queries, noise, seed)
+    card_ids = [str(i) for i in range(size)]
+
+    exact = FaceGallery(capacity=size)
+    for card_id, encoding in zip(card_ids, identities):
+        exact.add(card_id, encoding)
+    started = time.perf_counter()
+    ann = IVFGallery(min_train=min(size, 1024))
+    ann.add_many(card_ids, identities)
+    build_s = time.perf_counter() - started
+
+    truth, exact_ms = timed_queries(exact, probes)
+    row = {'size': size, 'lists': len(ann.centroids), 'build_s': round(build_s, 3),
+           'exact_ms': round(exact_ms, 3), 'ivf': []}
+    for n_probe in probe_counts:
+        found, ann_ms = timed_queries(ann, probes, n_probe=n_probe)
+        recall = float(np.mean([a == b for a, b in zip(found, truth)]))
+        row['ivf'].append({'n_probe': n_probe, 'recall_at_1': round(recall, 4),
+                           'query_ms': round(ann_ms, 3), 'speedup': round(exact_ms / ann_ms, 2)})
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description='IVF vs exact gallery benchmark.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--noise', type=float, default=0.03, help='per-dimension query noise')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rows = [benchmark(size, args.probes, args.queries, args.noise, args.seed) for size in args.sizes]
+    for row in rows:
+        print(f"{row['size']:>7} identities, {row['lists']} lists, built in {row['build_s']}s, "
+              f"exact {row['exact_ms']} ms/query")
+        for result in row['ivf']:
+            print(f"          n_probe={result['n_probe']:<3} recall@1={result['recall_at_1']:.4f} "
+                  f"{result['query_ms']} ms/query ({result['speedup']}x)")
+    print(json.dumps(rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Memory and accuracy of gallery representations on a roster.
+
+    python bench_quantization.py --store encodings
+    python bench_quantization.py --synthetic 100000
+
+Compares the old per-face Python lists, float64, float32 (FaceGallery),
+float16 and int8 (QuantizedGallery, with and without re-ranking).
+Accuracy is measured against exact float64 search. top1 is agreement on
+the nearest card id. decisions is agreement on the identify-or-reject
+outcome at --tolerance. max_err is the largest absolute error in the
+reported distance. Probes are roster encodings plus Gaussian noise. With
+--store, the roster is every encoding in the encoding store.
+
+Quantized sizes include the per-card Python bookkeeping (also reported
+separately as bookkeeping_bytes_per_encoding in the JSON); it is per card,
+so a synthetic roster of one encoding per card is its worst case. The
+spill file is excluded. The float32 row counts the encoding and norm
+arrays only. "no re-rank" rows report distances from the codes alone.
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from gallery import ENCODING_SIZE, FaceGallery
+from quantized_gallery import QuantizedGallery
+
+
+def load_roster(args):
+    if args.synthetic:
+        rng = np.random.default_rng(args.seed)
+        encodings = rng.normal(scale=1 / np.sqrt(ENCODING_SIZE), size=(args.synthetic, ENCODING_SIZE))
+        return [str(i) for i in range(args.synthetic)], encodings.astype(np.float32), 'synthetic'
+    from encoding_store import EncodingStore
+    entries = EncodingStore(args.store).entries()
+    if not entries:
+        sys.exit(f'No encodings in {args.store}; enroll some faces or use --synthetic N')
+    return [card_id for card_id, _ in entries], np.array([e for _, e in entries], dtype=np.float32), args.store
+
+
+def exact64(encodings, probes):
+    encodings = encodings.astype(np.float64)
+    probes = probes.astype(np.float64)
+    squared = (np.einsum('ij,ij->i', probes, probes)[:, None] + np.einsum('ij,ij->i', encodings, encodings)[None, :]
+               - 2.0 * probes @ encodings.T)
+    best = np.argmin(squared, axis=1)
+    return best, np.sqrt(np.maximum(squared[np.arange(len(probes)), best], 0))
+
+
+def python_list_bytes(encodings):
+    """Resident size of the original `encoding.tolist()` representation."""
+    sample = encodings[0].tolist()
+    return sys.getsizeof(sample) + sum(sys.getsizeof(value) for value in sample)
+
+
+def evaluate(name, gallery, resident_bytes, card_ids, probes, truth_ids, truth_distances, tolerance):
+    started = time.perf_counter()
+    results = gallery.match_batch(probes, tolerance=float('inf'))
+    query_ms = (time.perf_counter() - started) / len(probes) * 1000.0
+    found = [card_id for card_id, _ in results]
+    distances = np.array([distance for _, distance in results])
+    expected = [card_ids[i] for i in truth_ids]
+    return {
+        'representation': name,
+        'bytes_per_encoding': round(resident_bytes / len(card_ids), 1),
+        'total_mb': round(resident_bytes / 1e6, 2),
+        'top1': round(float(np.mean([a == b for a, b in zip(found, expected)])), 4),
+        'decisions': round(float(np.mean((distances <= tolerance) == (truth_distances <= tolerance))), 4),
+        'max_err': float(np.max(np.abs(distances - truth_distances))),
+        'query_ms': round(query_ms, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gallery quantization memory/accuracy report.')
+    parser.add_argument('--store', default='encodings', help='encoding store directory')
+    parser.add_argument('--synthetic', type=int, help='use N random identities instead of the store')
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--noise', type=float, default=0.03, help='per-dimension probe noise')
+    parser.add_argument('--tolerance', type=float, default=0.45)
+    parser.add_argument('--rerank', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    card_ids, encodings, source = load_roster(args)
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.integers(0, len(encodings), args.queries)
+    probes = (encodings[picks] + rng.normal(scale=args.noise, size=(args.queries, ENCODING_SIZE))).astype(np.float32)
+    truth_ids, truth_distances = exact64(encodings, probes)
+
+    rows = [{'representation': 'python list', 'bytes_per_encoding': python_list_bytes(encodings),
+             'total_mb': round(python_list_bytes(encodings) * len(encodings) / 1e6, 2)},
+            {'representation': 'float64', 'bytes_per_encoding': ENCODING_SIZE * 8,
+             'total_mb': round(ENCODING_SIZE * 8 * len(encodings) / 1e6, 2),
+             'top1': 1.0, 'decisions': 1.0, 'max_err': 0.0}]
+
+    exact = FaceGallery(capacity=len(encodings))
+    exact.add_many(card_ids, encodings)
+    rows.append(evaluate('float32', exact, len(encodings) * (ENCODING_SIZE + 1) * 4, card_ids, probes,
+                         truth_ids, truth_distances, args.tolerance))
+    for quantization in ('float16', 'int8'):
+        for rerank in (1, args.rerank):
+            gallery = QuantizedGallery(quantization=quantization, rerank=rerank, capacity=len(encodings))
+            gallery.add_many(card_ids, encodings)
+            name = f'{quantization} (re-rank {rerank})' if rerank > 1 else f'{quantization} (no re-rank)'
+            rows.append(evaluate(name, gallery, gallery.memory_bytes(), card_ids, probes,
+                                 truth_ids, truth_distances, args.tolerance))
+            rows[-1]['bookkeeping_bytes_per_encoding'] = round(gallery.bookkeeping_bytes() / len(card_ids), 1)
+            gallery.close()
+
+    print(f'{len(encodings)} encodings from {source}, {args.queries} probes, noise {args.noise}')
+    print(f"{'representation':<22}{'bytes/enc':>10}{'total MB':>10}{'top1':>8}{'decide':>8}{'max err':>10}{'ms/q':>8}")
+    for row in rows:
+        print(f"{row['representation']:<22}{row['bytes_per_encoding']:>10}{row['total_mb']:>10}"
+              f"{row.get('top1', ''):>8}{row.get('decisions', ''):>8}"
+              f"{'' if 'max_err' not in row else format(row['max_err'], '.1e'):>10}{row.get('query_ms', ''):>8}")
+    print(json.dumps(rows))
+
+
+if __name__ == '__main__':
+    main()
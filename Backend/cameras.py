@@ -0,0 +1,141 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+
+from capture import CaptureThread
+from recognition import RecognitionScheduler
+
+
+def parse_source(source):
+    """Device index for numeric sources, otherwise a file path or stream URL."""
+    source = str(source).strip()
+    return int(source) if source.isdigit() else source
+
+
+def camera_worker(camera_id, source, results, stop_event, interval):
+    """Capture and recognition loop for one camera, run in its own process.
+
+    Faces are detected, tracked and encoded here; encodings are sent back to
+    the parent, which matches them against the shared gallery. Only tracks
+    that were (re-)encoded carry an encoding, with the `encoded_seq` of the
+    frame it came from. An encoding that could not be sent because the
+    queue was full is sent again with the next message, since the track
+    may not be encoded again until the next keyframe.
+    """
+    capture = CaptureThread(parse_source(source))
+    if not capture.is_opened():
+        results.put({'camera_id': camera_id, 'error': f'Failed to open camera source {source}'})
+        capture.stop()
+        return
+    capture.start()
+    recognizer = RecognitionScheduler(gallery=None)
+    seq = 0
+    unsent = {}  # track_id -> (encoding, encoded_seq)
+    try:
+        while not stop_event.is_set():
+            seq, timestamp, frame = capture.frames.wait_newer(seq, timeout=1.0)
+            if frame is None:
+                continue
+            try:
+                tracks = recognizer.process(frame)
+            except Exception as e:
+                print(f"[ERROR] Camera {camera_id}: {e}")
+                continue
+            visible = {track.track_id for track in tracks}
+            unsent = {track_id: item for track_id, item in unsent.items() if track_id in visible}
+            for track in tracks:
+                if track.encoded_at == recognizer.frames:
+                    unsent[track.track_id] = (track.encoding, seq)
+            message = {
+                'camera_id': camera_id,
+                'seq': seq,
+                'timestamp': timestamp,
+                'faces': [{
+                    'track_id': track.track_id,
+                    'box': track.box,
+                    'encoding': unsent.get(track.track_id, (None, None))[0],
+                    'encoded_seq': unsent.get(track.track_id, (None, None))[1],
+                } for track in tracks],
+            }
+            try:
+                results.put_nowait(message)
+                unsent = {}
+            except queue.Full:
+                pass  # the parent is behind; boxes are superseded, unsent encodings go out next time
+            time.sleep(interval)
+    finally:
+        capture.stop()
+
+
+class CameraRegistry:
+    """Runs one capture + recognition worker process per registered source.
+
+    All workers report to the single `results` queue, which the web process
+    drains, so one busy camera never holds the GIL of another.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = float(interval or os.getenv('RECOGNITION_INTERVAL', 0.1))
+        self._context = multiprocessing.get_context('spawn')
+        self.results = self._context.Queue(maxsize=256)
+        self._cameras = {}
+        self._lock = threading.Lock()
+
+    def add(self, source, camera_id=None, name=None):
+        camera_id = camera_id or uuid.uuid4().hex[:8]
+        with self._lock:
+            if camera_id in self._cameras:
+                raise ValueError(f'Camera {camera_id} already exists')
+            stop_event = self._context.Event()
+            process = self._context.Process(
+                target=camera_worker,
+                args=(camera_id, source, self.results, stop_event, self.interval),
+                name=f'camera-{camera_id}',
+                daemon=True,
+            )
+            process.start()
+            self._cameras[camera_id] = {
+                'camera_id': camera_id,
+                'name': name or str(source),
+                'source': str(source),
+                'process': process,
+                'stop_event': stop_event,
+                'started_at': time.time(),
+            }
+        return self.describe(camera_id)
+
+    def describe(self, camera_id):
+        camera = self._cameras[camera_id]
+        return {
+            'camera_id': camera_id,
+            'name': camera['name'],
+            'source': camera['source'],
+            'alive': camera['process'].is_alive(),
+            'started_at': camera['started_at'],
+            'room': f'camera:{camera_id}',
+        }
+
+    def list(self):
+        with self._lock:
+            return [self.describe(camera_id) for camera_id in self._cameras]
+
+    def __contains__(self, camera_id):
+        return camera_id in self._cameras
+
+    def remove(self, camera_id, timeout=5.0):
+        with self._lock:
+            camera = self._cameras.pop(camera_id, None)
+        if camera is None:
+            return False
+        camera['stop_event'].set()
+        camera['process'].join(timeout)
+        if camera['process'].is_alive():
+            camera['process'].terminate()
+        return True
+
+    def stop_all(self):
+        for camera_id in list(self._cameras):
+            self.remove(camera_id)
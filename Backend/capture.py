@@ -0,0 +1,111 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class FrameRingBuffer:
+    """Fixed-size ring of preallocated frames published by one writer.
+
+    The writer fills the oldest slot in place and then publishes it, so
+    `latest()` hands consumers a reference to the newest frame without a
+    copy. A returned frame stays valid until `slots - 1` newer frames have
+    been published; consumers that keep a frame longer must copy it.
+    """
+
+    def __init__(self, slots=4):
+        self.slots = slots
+        self._frames = None
+        self._timestamps = np.zeros(slots)
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def writable_slot(self, shape, dtype=np.uint8):
+        """Slot the next frame should be written into (allocating on first use)."""
+        if self._frames is None or self._frames.shape[1:] != shape:
+            with self._cond:
+                self._frames = np.zeros((self.slots,) + tuple(shape), dtype=dtype)
+        return self._frames[self._seq % self.slots]
+
+    def publish(self, timestamp=None):
+        with self._cond:
+            self._timestamps[self._seq % self.slots] = time.time() if timestamp is None else timestamp
+            self._seq += 1
+            self._cond.notify_all()
+
+    def latest(self):
+        """(seq, timestamp, frame) of the newest frame, or (0, None, None)."""
+        with self._cond:
+            if not self._seq:
+                return 0, None, None
+            index = (self._seq - 1) % self.slots
+            return self._seq, self._timestamps[index], self._frames[index]
+
+    def wait_newer(self, seq, timeout=None):
+        """Block until a frame newer than `seq` is published, then return it."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq, timeout)
+        return self.latest()
+
+
+class CaptureThread:
+    """Owns a `cv2.VideoCapture` and publishes its frames to a ring buffer.
+
+    This is the only place that calls `.read()` on the device; streaming,
+    recognition and still capture all read from `frames`. `on_read(seconds)`
+    is called with the duration of every successful device read.
+    """
+
+    def __init__(self, source=0, slots=4, capture=None, on_read=None):
+        self.source = source
+        # Anything with the VideoCapture read/isOpened/release API works, e.g. a ReplaySource
+        self.capture = capture if capture is not None else cv2.VideoCapture(source)
+        self.frames = FrameRingBuffer(slots)
+        self.read_failures = 0
+        self.on_read = on_read
+        self._running = False
+        self._thread = None
+
+    def is_opened(self):
+        return self.capture.isOpened()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        shape = None
+        while self._running:
+            started = time.perf_counter()
+            if shape is None:
+                success, frame = self.capture.read()
+            else:
+                slot = self.frames.writable_slot(shape)
+                success, frame = self.capture.read(slot)
+            if not success:
+                self.read_failures += 1
+                time.sleep(0.01)
+                continue
+            if self.on_read is not None:
+                self.on_read(time.perf_counter() - started)
+            if shape is None or frame.shape != shape:
+                # First frame or a resolution change: (re)allocate and copy once
+                shape = frame.shape
+                slot = self.frames.writable_slot(shape, frame.dtype)
+                slot[...] = frame
+            elif frame is not slot:
+                slot[...] = frame
+            self.frames.publish()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.capture.release()
@@ -0,0 +1,65 @@
+import os
+import time
+
+
+class ResultCoalescer:
+    """Turns per-frame recognition results into state-change events.
+
+    A face only counts as identified once its track has matched the same
+    card id on `confirm_frames` consecutive encodings, which filters out
+    single-frame false positives. Between keyframes a track reports its
+    cached identity; those frames carry the same 'encoded_at' and are not
+    counted again, so confirmation takes `confirm_frames` independent
+    encodings rather than one encoding repeated. RecognitionScheduler
+    re-encodes unconfirmed tracks on every frame, so that normally means
+    `confirm_frames` consecutive frames. A confirmed card id then stays present
+    until it has not been seen for `cooldown` seconds, so a brief dropout
+    neither reports the student as lost nor announces them again.
+
+    `update()` returns True only when the visible face count or the set of
+    present identities changed.
+    """
+
+    def __init__(self, confirm_frames=None, cooldown=None):
+        self.confirm_frames = int(confirm_frames or os.getenv('MATCH_CONFIRM_FRAMES', 3))
+        self.cooldown = float(cooldown or os.getenv('MATCH_COOLDOWN', 5))
+        self.suppressed = 0
+        self.arrivals = set()
+        self._streaks = {}
+        self._last_seen = {}
+        self._state = None
+
+    def update(self, faces, now=None):
+        """Mark each face dict's 'confirmed' flag and report whether to emit.
+
+        Every face needs 'track_id' and 'card_id' keys, and 'encoded_at':
+        any value that changes whenever the track is re-encoded.
+        """
+        now = time.monotonic() if now is None else now
+        before = {card_id for card_id, seen in self._last_seen.items() if now - seen < self.cooldown}
+        streaks = {}
+        for face in faces:
+            card_id, count, encoded_at = self._streaks.get(face['track_id'], (None, 0, None))
+            if face['card_id'] != card_id:
+                count = 1
+            elif face['encoded_at'] != encoded_at:
+                count += 1
+            streaks[face['track_id']] = (face['card_id'], count, face['encoded_at'])
+            face['confirmed'] = face['card_id'] is not None and count >= self.confirm_frames
+            if face['confirmed']:
+                self._last_seen[face['card_id']] = now
+        self._streaks = streaks
+
+        self._last_seen = {card_id: seen for card_id, seen in self._last_seen.items()
+                           if now - seen < self.cooldown}
+        # Card ids that just became present, i.e. one sighting per visit
+        self.arrivals = set(self._last_seen) - before
+        state = (len(faces), frozenset(self._last_seen))
+        if state == self._state:
+            self.suppressed += 1
+            return False
+        self._state = state
+        return True
+
+    def present(self):
+        return set(self._last_seen)
@@ -0,0 +1,49 @@
+import os
+
+import cv2
+
+import face_models
+
+
+class FaceDetector:
+    """Face detection on a downscaled copy of the frame.
+
+    Detector cost grows with pixel count, so boxes are found on a frame
+    shrunk by `scale` (grayscale for HOG, RGB for the CNN model) and mapped
+    back to full-resolution coordinates. Encodings are then computed on the
+    original frame with those boxes as `known_face_locations`.
+    """
+
+    MODELS = ('hog', 'cnn')
+
+    def __init__(self, scale=None, model=None, upsample=None):
+        self.scale = float(scale if scale is not None else os.getenv('DETECTION_SCALE', 0.5))
+        self.model = model or os.getenv('FACE_DETECTION_MODEL', 'hog')
+        self.upsample = int(upsample if upsample is not None else os.getenv('DETECTION_UPSAMPLE', 1))
+        if self.model not in self.MODELS:
+            raise ValueError(f"Unknown face detection model: {self.model}")
+        if not 0 < self.scale <= 1:
+            raise ValueError(f"Detection scale must be in (0, 1], got {self.scale}")
+
+    def detect(self, rgb_frame):
+        """(top, right, bottom, left) boxes in `rgb_frame` coordinates."""
+        height, width = rgb_frame.shape[:2]
+        # dlib's HOG detector works on 8-bit grayscale; the CNN model needs RGB
+        image = rgb_frame if self.model == 'cnn' else cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+        if self.scale < 1:
+            image = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+        boxes = []
+        for top, right, bottom, left in face_models.load().face_locations(
+                image, number_of_times_to_upsample=self.upsample, model=self.model):
+            boxes.append((
+                max(int(top / self.scale), 0),
+                min(int(right / self.scale), width),
+                min(int(bottom / self.scale), height),
+                max(int(left / self.scale), 0),
+            ))
+        return boxes
+
+    def encode(self, rgb_frame, boxes):
+        """Encodings for `boxes`, computed at native resolution."""
+        return face_models.load().face_encodings(rgb_frame, known_face_locations=boxes)
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from gallery import ENCODING_SIZE
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.png', '.jpeg')
+# Separates a card id from a sample's timestamp; card ids may contain '_'
+SAMPLE_SEPARATOR = '@'
+
+
+def card_id_from_filename(name):
+    """`<card_id>.jpg` is a card's first photo, `<card_id>@<ms>.jpg` later samples."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    card_id, separator, stamp = stem.rpartition(SAMPLE_SEPARATOR)
+    return card_id if separator and card_id and stamp.isdigit() else stem
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EncodingStore:
+    """On-disk cache of face encodings for the files in `Images/`.
+
+    Encodings are appended as raw float32 rows to `encodings.f32` and read
+    back through a memory map. `manifest.json` maps every image filename to
+    its card id, mtime, size, sha1 and row, so a restart only re-encodes
+    files that are new or whose content changed.
+    """
+
+    MANIFEST = 'manifest.json'
+    MATRIX = 'encodings.f32'
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = os.path.join(path, self.MANIFEST)
+        self.matrix_path = os.path.join(path, self.MATRIX)
+        self._lock = threading.Lock()
+        self._files = {}
+        self._rows = 0
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] Ignoring unreadable encoding manifest: {e}")
+            return
+        rows = os.path.getsize(self.matrix_path) // (4 * ENCODING_SIZE) if os.path.exists(self.matrix_path) else 0
+        # Entries pointing past the end of the matrix come from an interrupted write
+        self._files = {name: entry for name, entry in manifest.get('files', {}).items()
+                       if entry.get('row') is None or entry['row'] < rows}
+        self._rows = rows
+
+    def _matrix(self):
+        if not self._rows:
+            return np.zeros((0, ENCODING_SIZE), dtype=np.float32)
+        return np.memmap(self.matrix_path, dtype=np.float32, mode='r',
+                         shape=(self._rows, ENCODING_SIZE))
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': 1, 'files': self._files}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _append(self, encoding):
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        with open(self.matrix_path, 'ab') as f:
+            f.write(encoding.tobytes())
+        self._rows += 1
+        return self._rows - 1
+
+    def _compact(self):
+        live = [name for name, entry in self._files.items() if entry.get('row') is not None]
+        if len(live) * 2 >= self._rows:
+            return
+        matrix = np.array(self._matrix()[[self._files[name]['row'] for name in live]])
+        tmp_path = self.matrix_path + '.tmp'
+        matrix.tofile(tmp_path)
+        os.replace(tmp_path, self.matrix_path)
+        for row, name in enumerate(live):
+            self._files[name]['row'] = row
+        self._rows = len(live)
+
+    def _record(self, filename, card_id, stat, digest, encoding, error=None):
+        self._files[filename] = {
+            'card_id': card_id,
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'sha1': digest,
+            'row': self._append(encoding) if encoding is not None else None,
+        }
+        if error is not None:
+            self._files[filename]['error'] = error
+
+    def sync(self, images_path, encode):
+        """Bring the store up to date with `images_path`.
+
+        `encode(image_path)` is only called for new or modified files and
+        must return a 128-d encoding, or None when no face was found. A file
+        it raises on (e.g. a corrupt JPEG) is recorded without an encoding,
+        with the error, and is retried only once the file changes.
+        Returns a list of (card_id, encoding) for every enrolled image; a card
+        with several sample photos appears once per sample.
+        """
+        with self._lock:
+            seen = set()
+            encoded = failed = 0
+            for image_name in sorted(os.listdir(images_path)):
+                if not image_name.endswith(IMAGE_EXTENSIONS):
+                    continue
+                seen.add(image_name)
+                image_path = os.path.join(images_path, image_name)
+                stat = os.stat(image_path)
+                entry = self._files.get(image_name)
+                if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                    continue
+                digest = file_digest(image_path)
+                if entry and entry['sha1'] == digest:
+                    entry['mtime'], entry['size'] = stat.st_mtime, stat.st_size
+                    continue
+                card_id = card_id_from_filename(image_name)
+                try:
+                    self._record(image_name, card_id, stat, digest, encode(image_path))
+                    encoded += 1
+                except Exception as e:
+                    print(f"[ERROR] Encoding store: cannot encode {image_name}: {e}")
+                    self._record(image_name, card_id, stat, digest, None, error=str(e))
+                    failed += 1
+
+            for image_name in set(self._files) - seen:
+                del self._files[image_name]
+            self._compact()
+            self._save_manifest()
+            print(f"[DEBUG] Encoding store: {len(seen)} images, {encoded} re-encoded, {failed} unreadable")
+
+            matrix = self._matrix()
+            return [(entry['card_id'], matrix[entry['row']])
+                    for entry in self._files.values() if entry.get('row') is not None]
+
+    def manifest_mtime(self):
+        """mtime of the manifest, or None before the first save."""
+        try:
+            return os.path.getmtime(self.manifest_path)
+        except OSError:
+            return None
+
+    def entries(self):
+        """(card_id, encoding) for every enrollment as last saved, without
+        scanning the image directory; for processes that don't own the store."""
+        with self._lock:
+            self._load()
+            matrix = self._matrix()
+            return [(entry['card_id'], matrix[entry['row']])
+                    for entry in self._files.values() if entry.get('row') is not None]
+
+    def put(self, image_path, card_id, encoding):
+        """Record a freshly enrolled image without rescanning the directory."""
+        with self._lock:
+            stat = os.stat(image_path)
+            self._record(os.path.basename(image_path), str(card_id), stat,
+                         file_digest(image_path), encoding)
+            self._save_manifest()
+
+    def put_many(self, items):
+        """Record several (image_path, card_id, encoding) enrollments at once."""
+        with self._lock:
+            for image_path, card_id, encoding in items:
+                self._record(os.path.basename(image_path), str(card_id), os.stat(image_path),
+                             file_digest(image_path), encoding)
+            self._save_manifest()
+
+    def discard(self, image_path):
+        with self._lock:
+            if self._files.pop(os.path.basename(image_path), None) is not None:
+                self._save_manifest()
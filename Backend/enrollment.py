@@ -0,0 +1,263 @@
+"""Bulk face enrollment.
+
+Detection and encoding of `<card_id>.jpg` files are fanned out across a
+process pool. Every photo passes the quality gate in `quality.py` (single
+face, minimum size, sharpness, exposure) before it is encoded. Usable from the `/api/bulk-enroll` endpoint or directly:
+
+    python enrollment.py path/to/photos_or_archive.zip --workers 8
+
+Photos are staged in a temporary directory and only moved into `Images/`
+once they encode, as an extra sample when the card already has a photo,
+so a batch never replaces or deletes an existing enrollment. The CLI
+writes to `Images/` and the encoding store; a running server picks the new
+enrollments up from the store on its next start.
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from werkzeug.utils import secure_filename
+
+import face_models
+from encoding_store import IMAGE_EXTENSIONS, SAMPLE_SEPARATOR
+from quality import assess_face_quality
+
+
+# Uncompressed size limit of a bulk enrollment archive
+MAX_ARCHIVE_BYTES = int(os.getenv('BULK_ENROLL_MAX_BYTES', 512 * 1024 * 1024))
+
+
+def _encode_single_face(load_image, result):
+    try:
+        image = load_image()
+        locations = face_models.load().face_locations(image)
+        if not locations:
+            result['error'] = 'No face detected in the image'
+        elif len(locations) > 1:
+            result['error'] = 'Multiple faces detected in the image'
+        else:
+            # Cheap checks first so unusable captures never reach the encoder
+            result['quality'] = assess_face_quality(image, locations[0])
+            if result['quality']['error']:
+                result['error'] = result['quality']['error']
+            else:
+                result['encoding'] = face_models.load().face_encodings(image, known_face_locations=locations)[0]
+                result['success'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def encode_enrollment_image(image_path):
+    """Detect and encode the single face in an enrollment photo.
+
+    Runs inside a pool worker, so it only returns plain picklable data.
+    """
+    result = {
+        'file': os.path.basename(image_path),
+        'path': image_path,
+        'card_id': os.path.splitext(os.path.basename(image_path))[0],
+        'success': False,
+        'error': None,
+        'encoding': None,
+    }
+    return _encode_single_face(lambda: face_models.load().load_image_file(image_path), result)
+
+
+def encode_image_file(image_path):
+    """Encoding of the first face in an `Images/` file, or None; the encoder of the startup sync.
+
+    Photos already in `Images/` were accepted when they were enrolled, so
+    the quality gate only reports on them here instead of dropping them.
+    """
+    image = face_models.load().load_image_file(image_path)
+    locations = face_models.load().face_locations(image)
+    if not locations:
+        return None
+    issue = ('multiple faces' if len(locations) > 1
+             else assess_face_quality(image, locations[0])['error'])
+    if issue:
+        print(f"[DEBUG] {os.path.basename(image_path)} would not pass enrollment today: {issue}")
+    return face_models.load().face_encodings(image, known_face_locations=locations[:1])[0]
+
+
+def encode_enrollment_data(image):
+    """Like encode_enrollment_image, for encoded image bytes or an RGB array.
+
+    Decodes in memory, so uploads never round-trip through the disk.
+    """
+    result = {'success': False, 'error': None, 'encoding': None}
+    if isinstance(image, (bytes, bytearray)):
+        return _encode_single_face(lambda: face_models.load().load_image_file(io.BytesIO(image)), result)
+    return _encode_single_face(lambda: image, result)
+
+
+def stage_images(source, staging_path, max_bytes=None):
+    """Copy or extract `<card_id>.<ext>` images from `source` into `staging_path`.
+
+    `source` is a directory, a zip path or a zip file object; `staging_path`
+    should be a fresh directory owned by the caller (see `commit_sample`).
+    Archives larger than `max_bytes` uncompressed raise ValueError. Returns
+    the staged paths and a list of failures for entries that were skipped.
+    """
+    staged, failures = [], []
+    max_bytes = max_bytes or MAX_ARCHIVE_BYTES
+
+    def accept(name):
+        filename = secure_filename(os.path.basename(name))
+        card_id, ext = os.path.splitext(filename)
+        if ext.lower() not in IMAGE_EXTENSIONS:
+            return None
+        if not card_id.isdigit():
+            failures.append({'file': name, 'card_id': card_id, 'success': False,
+                             'error': 'File name is not a numeric card ID'})
+            return None
+        target = os.path.join(staging_path, f"{card_id}{ext.lower()}")
+        if os.path.exists(target):
+            failures.append({'file': name, 'card_id': card_id, 'success': False,
+                             'error': 'Card ID appears more than once in the batch'})
+            return None
+        return target
+
+    if isinstance(source, str) and os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            target = accept(name)
+            if target is None:
+                continue
+            shutil.copyfile(os.path.join(source, name), target)
+            staged.append(target)
+    else:
+        with zipfile.ZipFile(source) as archive:
+            # Checked up front from the central directory, before anything is extracted
+            if sum(info.file_size for info in archive.infolist()) > max_bytes:
+                raise ValueError(f'Archive is larger than {max_bytes // (1024 * 1024)} MB uncompressed')
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                target = accept(info.filename)
+                if target is None:
+                    continue
+                with archive.open(info) as src, open(target, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                staged.append(target)
+    return staged, failures
+
+
+def sample_path(images_path, card_id, ext='.jpg'):
+    """Path for a new photo of `card_id` that never replaces an existing file.
+
+    The first photo is `<card_id><ext>`; later ones are `<card_id>@<ms><ext>`.
+    """
+    if not any(os.path.exists(os.path.join(images_path, f"{card_id}{other}")) for other in IMAGE_EXTENSIONS):
+        return os.path.join(images_path, f"{card_id}{ext}")
+    stamp = int(time.time() * 1000)
+    while os.path.exists(os.path.join(images_path, f"{card_id}{SAMPLE_SEPARATOR}{stamp}{ext}")):
+        stamp += 1
+    return os.path.join(images_path, f"{card_id}{SAMPLE_SEPARATOR}{stamp}{ext}")
+
+
+def migrate_sample_names(images_path):
+    """Rename extra samples saved as `<card_id>_<ms><ext>` to `<card_id>@<ms><ext>`.
+
+    Only files whose card also has a primary photo are renamed, so a card
+    id that merely ends in `_<digits>` keeps its name. Returns the count.
+    """
+    names = set(os.listdir(images_path))
+    stems = {os.path.splitext(name)[0] for name in names}
+    renamed = 0
+    for name in sorted(names):
+        stem, ext = os.path.splitext(name)
+        card_id, _, stamp = stem.rpartition('_')
+        if (ext.lower() in IMAGE_EXTENSIONS and card_id in stems and len(stamp) >= 13 and stamp.isdigit()
+                and f"{card_id}{SAMPLE_SEPARATOR}{stamp}{ext}" not in names):
+            os.rename(os.path.join(images_path, name),
+                      os.path.join(images_path, f"{card_id}{SAMPLE_SEPARATOR}{stamp}{ext}"))
+            renamed += 1
+    return renamed
+
+
+def commit_sample(staged_path, target_path):
+    """Move an encoded staging file to its place in the image directory."""
+    shutil.move(staged_path, target_path)
+    return target_path
+
+
+def bulk_enroll(image_paths, on_result, max_workers=None, max_in_flight=None):
+    """Encode `image_paths` in a process pool, calling `on_result` per file.
+
+    At most `max_in_flight` images are submitted at once so memory stays
+    bounded however large the batch is. Failures are reported through
+    `on_result` and never abort the batch.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or max_workers * 2
+    summary = {'total': len(image_paths), 'enrolled': 0, 'failed': 0}
+    paths = iter(image_paths)
+    context = multiprocessing.get_context('spawn')
+
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        pending = set()
+        while True:
+            for path in paths:
+                pending.add(pool.submit(encode_enrollment_image, path))
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                summary['enrolled' if result['success'] else 'failed'] += 1
+                on_result(result, summary)
+    return summary
+
+
+def main():
+    from encoding_store import EncodingStore
+
+    parser = argparse.ArgumentParser(description='Bulk enroll <card_id>.jpg face photos.')
+    parser.add_argument('source', help='directory or zip archive of <card_id>.jpg files')
+    parser.add_argument('--images', default='Images', help='enrollment image directory')
+    parser.add_argument('--store', default=os.getenv('ENCODING_STORE', 'encodings'),
+                        help='encoding store directory')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.source) and os.path.samefile(args.source, args.images):
+        parser.error('source is the image directory itself; start the server to encode it')
+    os.makedirs(args.images, exist_ok=True)
+    migrate_sample_names(args.images)
+    store = EncodingStore(args.store)
+    staging_path = tempfile.mkdtemp(prefix='bulk-enroll-')
+    enrolled = []
+
+    def on_result(result, summary):
+        done = summary['enrolled'] + summary['failed']
+        if result['success']:
+            ext = os.path.splitext(result['path'])[1]
+            image_path = commit_sample(result['path'], sample_path(args.images, result['card_id'], ext))
+            enrolled.append((image_path, result['card_id'], result['encoding']))
+            print(f"[{done}/{summary['total']}] {result['file']}: enrolled as {os.path.basename(image_path)}")
+        else:
+            print(f"[{done}/{summary['total']}] {result['file']}: {result['error']}")
+
+    try:
+        staged, failures = stage_images(args.source, staging_path)
+        for failure in failures:
+            print(f"[ERROR] {failure['file']}: {failure['error']}")
+        summary = bulk_enroll(staged, on_result, max_workers=args.workers)
+    finally:
+        store.put_many(enrolled)
+        shutil.rmtree(staging_path, ignore_errors=True)
+    print(f"Enrolled {summary['enrolled']} of {summary['total']} images, "
+          f"{summary['failed'] + len(failures)} failed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+import threading
+import time
+
+
+_api = None
+_lock = threading.Lock()
+load_seconds = None
+
+
+def load():
+    """The face_recognition module, imported on first use.
+
+    Importing face_recognition loads the dlib detector, landmark and
+    encoder models, which takes seconds, so modules that only might need
+    them call this instead of importing it at the top.
+    """
+    global _api, load_seconds
+    if _api is None:
+        with _lock:
+            if _api is None:
+                started = time.perf_counter()
+                import face_recognition
+                load_seconds = time.perf_counter() - started
+                _api = face_recognition
+    return _api
+
+
+def loaded():
+    return _api is not None
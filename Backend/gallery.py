@@ -0,0 +1,222 @@
+import os
+import threading
+from collections import deque
+
+import numpy as np
+
+
+ENCODING_SIZE = 128
+
+
+class FaceGallery:
+    """In-memory index of enrolled face encodings.
+
+    All encodings live in one contiguous float32 (N, 128) matrix with a
+    parallel array of card ids, so a probe is matched against the whole
+    roster with a single vectorized distance computation instead of a
+    Python loop over every card.
+    """
+
+    def __init__(self, capacity=256, tolerance=0.45):
+        self.tolerance = tolerance
+        self._encodings = np.zeros((capacity, ENCODING_SIZE), dtype=np.float32)
+        self._norms = np.zeros(capacity, dtype=np.float32)
+        self._card_ids = np.empty(capacity, dtype=object)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, card_id):
+        with self._lock:
+            return bool(np.any(self._card_ids[:self._size] == str(card_id)))
+
+    def card_ids(self):
+        with self._lock:
+            return set(self._card_ids[:self._size])
+
+    def _grow(self, needed):
+        capacity = len(self._encodings)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        encodings = np.zeros((capacity, ENCODING_SIZE), dtype=np.float32)
+        norms = np.zeros(capacity, dtype=np.float32)
+        card_ids = np.empty(capacity, dtype=object)
+        encodings[:self._size] = self._encodings[:self._size]
+        norms[:self._size] = self._norms[:self._size]
+        card_ids[:self._size] = self._card_ids[:self._size]
+        self._encodings, self._norms, self._card_ids = encodings, norms, card_ids
+
+    def add(self, card_id, encoding):
+        """Append one encoding for `card_id`; amortized O(1)."""
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        with self._lock:
+            self._grow(self._size + 1)
+            self._encodings[self._size] = encoding
+            self._norms[self._size] = np.dot(encoding, encoding)
+            self._card_ids[self._size] = str(card_id)
+            self._size += 1
+
+    def add_many(self, card_ids, encodings):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            start = self._size
+            self._grow(start + len(encodings))
+            self._encodings[start:start + len(encodings)] = encodings
+            self._norms[start:start + len(encodings)] = np.einsum('ij,ij->i', encodings, encodings)
+            self._card_ids[start:start + len(encodings)] = [str(card_id) for card_id in card_ids]
+            self._size += len(encodings)
+
+    def remove(self, card_id):
+        """Drop every encoding of `card_id`, filling the holes from the tail."""
+        with self._lock:
+            holes = np.flatnonzero(self._card_ids[:self._size] == str(card_id))
+            if not len(holes):
+                return 0
+            new_size = self._size - len(holes)
+            # Rows past the new end that are still live move into the holes
+            # that fall inside the new range.
+            tail = np.arange(new_size, self._size)
+            tail = tail[self._card_ids[tail] != str(card_id)]
+            holes = holes[holes < new_size]
+            self._encodings[holes] = self._encodings[tail]
+            self._norms[holes] = self._norms[tail]
+            self._card_ids[holes] = self._card_ids[tail]
+            self._card_ids[new_size:self._size] = None
+            removed = self._size - new_size
+            self._size = new_size
+            return removed
+
+    def replace(self, card_id, encodings):
+        self.remove(card_id)
+        for encoding in encodings:
+            self.add(card_id, encoding)
+
+    def distances(self, probes):
+        """Euclidean distance matrix of shape (len(probes), N)."""
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            encodings = self._encodings[:self._size]
+            norms = self._norms[:self._size]
+            card_ids = self._card_ids[:self._size].copy()
+            # |a - b|^2 = |a|^2 + |b|^2 - 2ab, one matrix product for the batch
+            squared = (np.einsum('ij,ij->i', probes, probes)[:, None]
+                       + norms[None, :] - 2.0 * probes @ encodings.T)
+        np.maximum(squared, 0.0, out=squared)
+        return np.sqrt(squared), card_ids
+
+    def match_batch(self, probes, tolerance=None):
+        """Best (card_id, distance) for every probe.
+
+        card_id is None when the gallery is empty or the closest encoding is
+        farther than `tolerance`.
+        """
+        tolerance = self.tolerance if tolerance is None else tolerance
+        distances, card_ids = self.distances(probes)
+        if not len(card_ids):
+            return [(None, None)] * len(distances)
+        best = np.argmin(distances, axis=1)
+        results = []
+        for row, index in enumerate(best):
+            distance = float(distances[row, index])
+            card_id = card_ids[index] if distance <= tolerance else None
+            results.append((card_id, distance))
+        return results
+
+    def match(self, probe, tolerance=None):
+        return self.match_batch([probe], tolerance)[0]
+
+
+def aggregate_templates(samples, diverse=2):
+    """Mean embedding plus up to `diverse` mutually distant samples.
+
+    Samples are picked by greedy farthest-point selection, starting from
+    the one farthest from the mean, so the templates cover the spread of
+    poses and lighting while their number per identity stays fixed.
+    """
+    samples = np.asarray(samples, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    if len(samples) <= 1:
+        return samples
+    mean = samples.mean(axis=0)
+    nearest = np.linalg.norm(samples - mean, axis=1)
+    chosen = []
+    for _ in range(min(diverse, len(samples))):
+        index = int(np.argmax(nearest))
+        chosen.append(index)
+        nearest = np.minimum(nearest, np.linalg.norm(samples - samples[index], axis=1))
+    return np.vstack([mean[None, :], samples[chosen]])
+
+
+class TemplateBank:
+    """Keeps the last `max_samples` enrollment samples per card and puts only
+    their aggregated templates into the gallery, so match cost per identity
+    stays constant however many times a student is enrolled.
+    """
+
+    def __init__(self, gallery, max_samples=None, diverse=None):
+        self.gallery = gallery
+        self.max_samples = int(max_samples or os.getenv('ENROLL_MAX_SAMPLES', 10))
+        self.diverse = int(diverse if diverse is not None else os.getenv('ENROLL_DIVERSE_TEMPLATES', 2))
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def load(self, items):
+        """Bulk-load (card_id, encoding) samples, e.g. from the encoding store."""
+        with self._lock:
+            for card_id, encoding in items:
+                self._samples.setdefault(str(card_id), deque(maxlen=self.max_samples)).append(
+                    np.asarray(encoding, dtype=np.float32))
+            card_ids, templates = [], []
+            for card_id, samples in self._samples.items():
+                for template in aggregate_templates(list(samples), self.diverse):
+                    card_ids.append(card_id)
+                    templates.append(template)
+            if templates:
+                self.gallery.add_many(card_ids, templates)
+
+    def sync(self, items):
+        """Make the gallery match `items`, re-aggregating only cards whose
+        samples changed. Returns the number of cards updated or removed."""
+        grouped = {}
+        for card_id, encoding in items:
+            grouped.setdefault(str(card_id), deque(maxlen=self.max_samples)).append(
+                np.asarray(encoding, dtype=np.float32))
+        with self._lock:
+            removed = set(self._samples) - set(grouped)
+            updates = {}
+            for card_id, samples in grouped.items():
+                current = self._samples.get(card_id)
+                if (current is not None and len(current) == len(samples)
+                        and all(np.array_equal(a, b) for a, b in zip(current, samples))):
+                    continue
+                self._samples[card_id] = samples
+                updates[card_id] = aggregate_templates(list(samples), self.diverse)
+            for card_id in removed:
+                del self._samples[card_id]
+                self.gallery.remove(card_id)
+            for card_id, templates in updates.items():
+                self.gallery.replace(card_id, templates)
+        return len(removed) + len(updates)
+
+    def card_ids(self):
+        with self._lock:
+            return list(self._samples)
+
+    def sample_count(self, card_id):
+        with self._lock:
+            return len(self._samples.get(str(card_id), ()))
+
+    def enroll(self, card_id, encoding):
+        with self._lock:
+            samples = self._samples.setdefault(str(card_id), deque(maxlen=self.max_samples))
+            samples.append(np.asarray(encoding, dtype=np.float32))
+            # Held across the replace, so concurrent enrollments of a card reach the gallery in order
+            self.gallery.replace(card_id, aggregate_templates(list(samples), self.diverse))
+
+    def remove(self, card_id):
+        with self._lock:
+            self._samples.pop(str(card_id), None)
+            self.gallery.remove(card_id)
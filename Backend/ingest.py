@@ -0,0 +1,237 @@
+import base64
+import json
+import math
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from student_cache import message_queue_manager
+
+
+class _Client:
+    __slots__ = ('client_id', 'room', 'jpeg', 'queued_at', 'seq', 'done_seq', 'busy', 'tokens',
+                 'refilled_at', 'last_seen', 'result', 'state', 'received', 'replaced', 'limited')
+
+    def __init__(self, client_id, room):
+        self.client_id = client_id
+        self.room = room
+        self.jpeg = None
+        self.queued_at = None
+        self.seq = 0
+        self.done_seq = 0
+        self.busy = False
+        # Rate-limit bucket; starts full so a new client can send a burst
+        self.tokens = None
+        self.refilled_at = time.time()
+        self.last_seen = time.time()
+        self.result = None
+        # Per-client pipeline state (tracker, coalescer), owned by the handler
+        self.state = {}
+        self.received = 0
+        self.replaced = 0
+        self.limited = 0
+
+
+class ClientFrameIngest:
+    """Recognition for frames pushed by clients instead of read from a device.
+
+    Every client has a single slot holding only its newest JPEG: a frame
+    that arrives before the previous one was picked up replaces it, so a
+    slow link or a busy encoder never builds a backlog of stale frames.
+    Each client has a token bucket refilled at `max_fps` and holding up to
+    `burst` frames, so a device sending at `max_fps` with network jitter is
+    not refused, while frames beyond that rate are, before they are
+    decoded. Worker threads serve the client that has waited
+    longest, so one device cannot monopolise the encoder.
+
+    `handler(client, frame_bgr)` runs on a worker thread and returns the
+    result stored for `wait_result()`; with `decode=False` it gets the JPEG
+    bytes instead. Clients idle for `idle_timeout` seconds are forgotten.
+    """
+
+    def __init__(self, handler, max_fps=None, workers=None, max_frame_bytes=None, idle_timeout=60.0,
+                 decode=True, burst=None):
+        self.handler = handler
+        self.decode = decode
+        self.max_fps = float(max_fps or os.getenv('CLIENT_MAX_FPS', 5))
+        self.burst = float(burst or os.getenv('CLIENT_BURST', 3))
+        self.workers = int(workers or os.getenv('INGEST_WORKERS', 1))
+        self.max_frame_bytes = int(max_frame_bytes or os.getenv('CLIENT_MAX_FRAME_BYTES', 2 * 1024 * 1024))
+        self.idle_timeout = idle_timeout
+        self.processed = 0
+        self.replaced = 0
+        self.rate_limited = 0
+        self._clients = {}
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'frame-ingest-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def clients(self):
+        return len(self._clients)
+
+    def submit(self, client_id, jpeg, room=None):
+        """Queue `jpeg` as the client's latest frame.
+
+        Returns (status, seq) where status is 'queued', 'replaced' (an
+        unprocessed frame was dropped for this one), 'rate_limited' or
+        'too_large'.
+        """
+        if len(jpeg) > self.max_frame_bytes:
+            return 'too_large', None
+        now = time.time()
+        with self._cond:
+            client = self._clients.get(client_id)
+            if client is None:
+                client = self._clients[client_id] = _Client(client_id, room)
+            client.last_seen = now
+            if not self._take_token(client, now):
+                client.limited += 1
+                self.rate_limited += 1
+                return 'rate_limited', client.seq
+            status = 'replaced' if client.jpeg is not None else 'queued'
+            if client.jpeg is not None:
+                client.replaced += 1
+                self.replaced += 1
+            else:
+                client.queued_at = now
+            client.jpeg = bytes(jpeg)
+            client.seq += 1
+            client.received += 1
+            self._cond.notify()
+            return status, client.seq
+
+    def retry_after(self, client_id):
+        with self._cond:
+            client = self._clients.get(client_id)
+            if client is None or math.isinf(self.max_fps) or client.tokens is None or client.tokens >= 1.0:
+                return 0.0
+            return max((1.0 - client.tokens) / self.max_fps - (time.time() - client.refilled_at), 0.0)
+
+    def _take_token(self, client, now):
+        if math.isinf(self.max_fps):
+            return True
+        if client.tokens is None:
+            client.tokens = self.burst
+        else:
+            client.tokens = min(client.tokens + (now - client.refilled_at) * self.max_fps, self.burst)
+        client.refilled_at = now
+        if client.tokens < 1.0:
+            return False
+        client.tokens -= 1.0
+        return True
+
+    def wait_result(self, client_id, seq, timeout=2.0):
+        """The result of frame `seq` (or a newer one), or None on timeout."""
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                client = self._clients.get(client_id)
+                if client is None:
+                    return None
+                if client.done_seq >= seq:
+                    return client.result
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def remove(self, client_id):
+        with self._cond:
+            self._clients.pop(client_id, None)
+
+    def _next_client(self):
+        ready = [client for client in self._clients.values() if client.jpeg is not None and not client.busy]
+        return min(ready, key=lambda client: client.queued_at) if ready else None
+
+    def _expire(self, now):
+        for client_id, client in list(self._clients.items()):
+            if not client.busy and now - client.last_seen > self.idle_timeout:
+                del self._clients[client_id]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._expire(time.time())
+                client = self._next_client()
+                while client is None:
+                    self._cond.wait(timeout=self.idle_timeout)
+                    self._expire(time.time())
+                    client = self._next_client()
+                jpeg, seq = client.jpeg, client.seq
+                client.jpeg, client.busy = None, True
+
+            try:
+                frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR) if self.decode else jpeg
+                if frame is None:
+                    result = {'error': 'Frame is not a valid JPEG image'}
+                else:
+                    result = self.handler(client, frame)
+            except Exception as e:
+                print(f"[ERROR] Frame from client {client.client_id} failed: {e}")
+                result = {'error': str(e)}
+
+            with self._cond:
+                client.busy = False
+                client.result, client.done_seq = result, seq
+                self.processed += 1
+                self._cond.notify_all()
+
+
+class FrameChannel:
+    """Carries client frames from the web tier to the recognition worker.
+
+    In the web role the ingest handler only forwards: rate limiting and the
+    latest-frame slot still apply in the web process, and the worker feeds
+    what it receives into its own ClientFrameIngest. Frames travel over
+    `frames`, a queue shared with a spawned worker, or over a channel of the
+    SocketIO message queue at `url`. A frame that does not fit is dropped;
+    the client's next one supersedes it anyway.
+    """
+
+    CHANNEL = 'client-frames'
+
+    def __init__(self, frames=None, url=None):
+        self.frames = frames
+        self._manager = message_queue_manager(url, self.CHANNEL) if url else None
+        self.dropped = 0
+
+    def publish(self, client_id, jpeg, room):
+        try:
+            if self.frames is not None:
+                self.frames.put_nowait((client_id, bytes(jpeg), room))
+            if self._manager is not None:
+                self._manager._publish({'client_id': client_id, 'room': room,
+                                        'image': base64.b64encode(jpeg).decode('ascii')})
+            return True
+        except queue.Full:
+            self.dropped += 1
+        except Exception as e:
+            self.dropped += 1
+            print(f"[ERROR] Cannot forward frame from client {client_id}: {e}")
+        return False
+
+    def listen(self, submit):
+        """Call `submit(client_id, jpeg, room=room)` for every forwarded frame."""
+        if self.frames is not None:
+            while True:
+                try:
+                    client_id, jpeg, room = self.frames.get()
+                except (EOFError, OSError):
+                    return
+                submit(client_id, jpeg, room=room)
+        for message in self._manager._listen():
+            try:
+                message = message if isinstance(message, dict) else json.loads(message)
+                submit(message['client_id'], base64.b64decode(message['image']), room=message['room'])
+            except (KeyError, TypeError, ValueError):
+                continue
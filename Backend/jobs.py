@@ -0,0 +1,114 @@
+import contextlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from enrollment import encode_enrollment_data
+
+
+class EnrollmentJobs:
+    """Runs single-image enrollments on a process pool as tracked jobs.
+
+    `submit()` returns a job id immediately. A job is 'queued' until a pool
+    worker picks it up, then 'running'. When the encoding finishes,
+    `on_complete(job, result, context)` is called with the worker result on
+    the jobs' own completion thread, inside `app_context()` when given; its
+    return value (an error message or None) decides whether the job ends
+    as 'done' or 'failed'. After that, `on_finished(job, context)` gets the
+    final job state. Only the most recent `max_jobs` jobs are kept for
+    status polling.
+    """
+
+    def __init__(self, on_complete, on_finished=None, max_workers=None, max_jobs=1000, app_context=None):
+        self.on_complete = on_complete
+        self.on_finished = on_finished
+        self.max_jobs = max_jobs
+        self.app_context = app_context or contextlib.nullcontext
+        self._pool = ProcessPoolExecutor(
+            max_workers=int(max_workers or os.getenv('ENROLLMENT_WORKERS', 2)),
+            mp_context=multiprocessing.get_context('spawn'))
+        self._jobs = OrderedDict()
+        self._futures = {}
+        self._lock = threading.Lock()
+        # The pool's callback thread only hands results over; file, database and gallery work happens here
+        self._completed = queue.Queue()
+        threading.Thread(target=self._complete_loop, name='enrollment-completion', daemon=True).start()
+
+    def submit(self, card_id, image, context=None):
+        """Queue `image` (encoded bytes or an RGB array) for enrollment as `card_id`."""
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'card_id': str(card_id),
+            'kind': (context or {}).get('kind'),
+            'status': 'queued',
+            'error': None,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+        }
+        future = self._pool.submit(encode_enrollment_data, image)
+        with self._lock:
+            self._jobs[job['job_id']] = job
+            self._futures[job['job_id']] = future
+            while len(self._jobs) > self.max_jobs:
+                self._futures.pop(self._jobs.popitem(last=False)[0], None)
+        future.add_done_callback(lambda future: self._completed.put((job, future, context)))
+        return dict(job)
+
+    def _mark_running(self, job):
+        if job['status'] == 'queued':
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+
+    def _refresh(self):
+        # The pool has no start hook; a future turns running once a worker takes it
+        for job_id, future in list(self._futures.items()):
+            if future.running():
+                self._mark_running(self._jobs[job_id])
+
+    def _complete_loop(self):
+        while True:
+            item = self._completed.get()
+            if item is None:
+                return
+            self._finish(*item)
+
+    def _finish(self, job, future, context):
+        with self._lock:
+            self._mark_running(job)
+            self._futures.pop(job['job_id'], None)
+        try:
+            result = future.result()
+            with self.app_context():
+                error = self.on_complete(job, result, context)
+        except Exception as e:
+            error = str(e)
+        job['status'] = 'failed' if error else 'done'
+        job['error'] = error
+        job['finished_at'] = time.time()
+        if self.on_finished is not None:
+            try:
+                with self.app_context():
+                    self.on_finished(dict(job), context)
+            except Exception as e:
+                print(f"[ERROR] Enrollment job {job['job_id']} notification failed: {e}")
+
+    def get(self, job_id):
+        with self._lock:
+            self._refresh()
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def pending(self):
+        with self._lock:
+            self._refresh()
+            return sum(1 for job in self._jobs.values() if job['status'] == 'queued')
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._completed.put(None)
@@ -0,0 +1,163 @@
+"""CPU-only liveness checks for tracked faces.
+
+Runs on the face region of each track before it is encoded, so a photo or
+a phone screen held up to the camera never costs an encoding. Strictness
+levels, from LIVENESS_STRICTNESS:
+
+* off: every face is treated as live;
+* low: reject faces whose spectrum shows the periodic peaks of a screen or
+  halftone print (moire);
+* medium: also require non-rigid micro-motion inside the face (eyes,
+  mouth, skin) within `window` frames; a flat photo only moves rigidly;
+* high: also require a blink, from the eye aspect ratio of dlib landmarks.
+
+`update()` returns True (live), False (spoof) or None (no decision yet).
+A track that produced no evidence within its window is reported as a
+spoof but can still turn live later. Thresholds are starting points; tune
+them on replays of the actual glasses camera.
+"""
+import os
+
+import cv2
+import numpy as np
+
+import face_models
+
+
+STRICTNESS_LEVELS = ('off', 'low', 'medium', 'high')
+ROI_SIZE = 64
+
+
+def eye_aspect_ratio(eye):
+    """Height over width of a six-point dlib eye contour; drops during a blink."""
+    eye = np.asarray(eye, dtype=np.float32)
+    height = np.linalg.norm(eye[1] - eye[5]) + np.linalg.norm(eye[2] - eye[4])
+    width = np.linalg.norm(eye[0] - eye[3])
+    return float(height / (2.0 * width)) if width else 0.0
+
+
+_WINDOW = np.outer(np.hanning(ROI_SIZE), np.hanning(ROI_SIZE)).astype(np.float32)
+_RINGS = np.hypot(*np.ogrid[-(ROI_SIZE // 2):ROI_SIZE // 2, -(ROI_SIZE // 2):ROI_SIZE // 2]).astype(int)
+_BAND = (_RINGS >= ROI_SIZE // 8) & (_RINGS < ROI_SIZE // 2)
+
+
+def moire_score(roi):
+    """Strongest mid/high-frequency spectral peak relative to its own ring.
+
+    Natural skin has a smooth, roughly isotropic spectrum, so every
+    frequency ring is close to its mean; screens and prints add isolated
+    peaks at their pixel or dot pitch.
+    """
+    spectrum = np.abs(np.fft.fftshift(np.fft.fft2((roi - roi.mean()) * _WINDOW)))
+    ring_mean = np.bincount(_RINGS.ravel(), spectrum.ravel()) / np.maximum(np.bincount(_RINGS.ravel()), 1)
+    ratio = spectrum[_BAND] / np.maximum(ring_mean[_RINGS[_BAND]], 1e-6)
+    return float(ratio.max())
+
+
+class _TrackState:
+    __slots__ = ('roi', 'frames', 'moved', 'blinked', 'eyes_open', 'screen_hits')
+
+    def __init__(self):
+        self.roi = None
+        self.frames = 0
+        self.moved = False
+        self.blinked = False
+        self.eyes_open = False
+        self.screen_hits = 0
+
+
+class LivenessChecker:
+    def __init__(self, strictness=None, window=None, moire_threshold=None, motion_threshold=None,
+                 blink_threshold=0.21, open_threshold=0.25):
+        self.strictness = strictness or os.getenv('LIVENESS_STRICTNESS', 'off')
+        if self.strictness not in STRICTNESS_LEVELS:
+            raise ValueError(f"strictness must be one of {', '.join(STRICTNESS_LEVELS)}")
+        self.window = int(window or os.getenv('LIVENESS_WINDOW', 15))
+        self.moire_threshold = float(moire_threshold or os.getenv('LIVENESS_MOIRE_THRESHOLD', 12))
+        self.motion_threshold = float(motion_threshold or os.getenv('LIVENESS_MOTION_THRESHOLD', 1.5))
+        self.blink_threshold = blink_threshold
+        self.open_threshold = open_threshold
+        # Frames on which a face was judged a spoof and left unencoded
+        self.rejected = 0
+        self._states = {}
+
+    @property
+    def enabled(self):
+        return self.strictness != 'off'
+
+    def _roi(self, gray, box):
+        top, right, bottom, left = box
+        face = gray[max(top, 0):bottom, max(left, 0):right]
+        if not face.size:
+            return None
+        return cv2.resize(face, (ROI_SIZE, ROI_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def _patch(self, gray, box):
+        """Native-resolution patch from the face centre; downscaling would
+        average away the very patterns the moire check looks for."""
+        top, right, bottom, left = box
+        if bottom - top < ROI_SIZE or right - left < ROI_SIZE:
+            return None
+        y, x = (top + bottom) // 2 - ROI_SIZE // 2, (left + right) // 2 - ROI_SIZE // 2
+        patch = gray[max(y, 0):y + ROI_SIZE, max(x, 0):x + ROI_SIZE]
+        return patch.astype(np.float32) if patch.shape == (ROI_SIZE, ROI_SIZE) else None
+
+    def _residual_motion(self, previous, roi):
+        """Mean change inside the face after undoing its rigid shift."""
+        (dx, dy), _ = cv2.phaseCorrelate(previous, roi)
+        aligned = cv2.warpAffine(previous, np.float32([[1, 0, dx], [0, 1, dy]]), (ROI_SIZE, ROI_SIZE),
+                                 borderMode=cv2.BORDER_REPLICATE)
+        # Normalise exposure so auto-gain changes do not read as motion
+        residual = (roi - roi.mean()) - (aligned - aligned.mean())
+        return float(np.mean(np.abs(residual[4:-4, 4:-4])))
+
+    def _blink(self, state, rgb, box):
+        landmarks = face_models.load().face_landmarks(rgb, [box])
+        if not landmarks:
+            return
+        ratio = (eye_aspect_ratio(landmarks[0]['left_eye']) + eye_aspect_ratio(landmarks[0]['right_eye'])) / 2
+        if ratio >= self.open_threshold:
+            state.eyes_open = True
+        elif ratio < self.blink_threshold and state.eyes_open:
+            state.blinked = True
+
+    def update(self, track_id, gray, rgb, box):
+        """Feed the track's face from the current frame and return its verdict."""
+        if not self.enabled:
+            return True
+        roi = self._roi(gray, box)
+        if roi is None:
+            return None
+        state = self._states.setdefault(track_id, _TrackState())
+        state.frames += 1
+
+        # Two consecutive hits, so a single noisy frame does not flag a real face
+        patch = self._patch(gray, box)
+        screen = patch is not None and moire_score(patch) > self.moire_threshold
+        state.screen_hits = state.screen_hits + 1 if screen else 0
+        if state.screen_hits >= 2:
+            self.rejected += 1
+            return False
+        if self.strictness in ('medium', 'high') and not state.moved and state.roi is not None:
+            state.moved = self._residual_motion(state.roi, roi) > self.motion_threshold
+        state.roi = roi
+        if self.strictness == 'high' and not state.blinked:
+            self._blink(state, rgb, box)
+
+        if self.strictness == 'low':
+            live = state.frames >= 2
+        elif self.strictness == 'medium':
+            live = state.moved
+        else:
+            live = state.moved and state.blinked
+        if live:
+            return True
+        if state.frames < self.window:
+            return None
+        self.rejected += 1
+        return False
+
+    def prune(self, track_ids):
+        """Forget tracks that are no longer followed."""
+        for track_id in set(self._states) - set(track_ids):
+            del self._states[track_id]
@@ -0,0 +1,193 @@
+"""Minimal in-process metrics rendered in the Prometheus text format.
+
+Recording is a bisect plus a few additions under a lock, cheap enough to
+leave on in the recognition and streaming loops.
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+
+class Histogram:
+    """Cumulative Prometheus histogram plus a rolling window for quantiles."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window=512):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._window = np.zeros(window)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._window[self.count % len(self._window)] = value
+            self.sum += value
+            self.count += 1
+
+    def recent_quantiles(self, quantiles=(0.5, 0.9, 0.99)):
+        with self._lock:
+            recent = self._window[:min(self.count, len(self._window))].copy()
+        if not len(recent):
+            return {}
+        return dict(zip(quantiles, np.quantile(recent, quantiles)))
+
+
+class MetricsRegistry:
+    def __init__(self, prefix='smartglass'):
+        self.prefix = prefix
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._counter_callbacks = {}
+        self._included = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def histogram(self, name, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+                if help_text:
+                    self._help[name] = help_text
+        return histogram
+
+    def observe(self, name, seconds, **labels):
+        self.histogram(name, **labels).observe(seconds)
+
+    def timer(self, name, **labels):
+        return _Timer(self.histogram(name, **labels))
+
+    def inc(self, name, amount=1, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            if help_text:
+                self._help[name] = help_text
+
+    def gauge(self, name, callback, help_text=''):
+        """Register `callback() -> number` (or {labels tuple: number}), read at scrape time."""
+        self._gauges[name] = callback
+        self._help[name] = help_text
+
+    def counter(self, name, callback, help_text=''):
+        """Like `gauge`, for a running total kept elsewhere; rendered as `<name>_total`."""
+        self._counter_callbacks[name] = callback
+        self._help[name] = help_text
+
+    def include(self, source, text):
+        """Append another process's rendered metrics, replacing its previous text."""
+        self._included[source] = text
+
+    def render(self):
+        lines = []
+
+        def header(name, kind, help_name=None):
+            full_name = f'{self.prefix}_{name}'
+            help_text = self._help.get(help_name or name)
+            if help_text:
+                lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {kind}')
+            return full_name
+
+        by_name = {}
+        for (name, labels), histogram in list(self._histograms.items()):
+            by_name.setdefault(name, []).append((dict(labels), histogram))
+        for name, series in sorted(by_name.items()):
+            full_name = header(name, 'histogram')
+            for labels, histogram in series:
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{full_name}_bucket{_labels({**labels, "le": le})} {cumulative}')
+                lines.append(f'{full_name}_sum{_labels(labels)} {histogram.sum}')
+                lines.append(f'{full_name}_count{_labels(labels)} {histogram.count}')
+            full_name = header(f'{name}_recent', 'gauge', help_name=name)
+            for labels, histogram in series:
+                for quantile, value in histogram.recent_quantiles().items():
+                    lines.append(f'{full_name}{_labels({**labels, "quantile": quantile})} {value}')
+
+        counters = {}
+        for (name, labels), value in list(self._counters.items()):
+            counters.setdefault(name, []).append((dict(labels), value))
+        for name, series in sorted(counters.items()):
+            full_name = header(f'{name}_total', 'counter', help_name=name)
+            for labels, value in series:
+                lines.append(f'{full_name}{_labels(labels)} {value}')
+
+        callbacks = [(name, 'counter', callback) for name, callback in self._counter_callbacks.items()]
+        callbacks += [(name, 'gauge', callback) for name, callback in self._gauges.items()]
+        for name, kind, callback in sorted(callbacks):
+            try:
+                value = callback()
+            except Exception:
+                continue
+            full_name = header(f'{name}_total' if kind == 'counter' else name, kind, help_name=name)
+            if isinstance(value, dict):
+                for labels, item in value.items():
+                    lines.append(f'{full_name}{_labels(dict(labels))} {item}')
+            else:
+                lines.append(f'{full_name} {value}')
+        text = '\n'.join(lines) + '\n'
+        return text + ''.join(self._included[source] for source in sorted(self._included))
+
+
+def start_http_server(registry, port, host=''):
+    """Serve `registry` on http://host:port/metrics from a daemon thread.
+
+    For processes without a web server of their own, such as a standalone
+    recognition worker.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
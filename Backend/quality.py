@@ -0,0 +1,37 @@
+import os
+
+import cv2
+import numpy as np
+
+
+MIN_FACE_SIZE = int(os.getenv('ENROLL_MIN_FACE_SIZE', 80))
+MIN_SHARPNESS = float(os.getenv('ENROLL_MIN_SHARPNESS', 50))
+MIN_BRIGHTNESS = float(os.getenv('ENROLL_MIN_BRIGHTNESS', 50))
+MAX_BRIGHTNESS = float(os.getenv('ENROLL_MAX_BRIGHTNESS', 210))
+
+
+def assess_face_quality(rgb_image, location):
+    """Size, sharpness and brightness of the face at `location`.
+
+    Sharpness is the variance of the Laplacian over the face crop; low
+    values mean a blurry capture. Returns the measurements plus an 'error'
+    describing the first failed check, or None when the face is usable.
+    """
+    top, right, bottom, left = location
+    face = cv2.cvtColor(np.ascontiguousarray(rgb_image[max(top, 0):bottom, max(left, 0):right]),
+                        cv2.COLOR_RGB2GRAY)
+    quality = {
+        'face_size': int(min(bottom - top, right - left)),
+        'sharpness': round(float(cv2.Laplacian(face, cv2.CV_64F).var()), 2) if face.size else 0.0,
+        'brightness': round(float(face.mean()), 2) if face.size else 0.0,
+        'error': None,
+    }
+    if quality['face_size'] < MIN_FACE_SIZE:
+        quality['error'] = f"Face is too small ({quality['face_size']}px, need {MIN_FACE_SIZE}px); move closer"
+    elif quality['sharpness'] < MIN_SHARPNESS:
+        quality['error'] = 'Image is too blurry; hold still and retake'
+    elif quality['brightness'] < MIN_BRIGHTNESS:
+        quality['error'] = 'Image is too dark'
+    elif quality['brightness'] > MAX_BRIGHTNESS:
+        quality['error'] = 'Image is overexposed'
+    return quality
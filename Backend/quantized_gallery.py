@@ -0,0 +1,260 @@
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from gallery import ENCODING_SIZE
+
+
+QUANTIZATIONS = ('float16', 'int8')
+SPILL_FILE = re.compile(r'^gallery-(\d+)\.f32$')
+
+
+def _process_alive(pid):
+    if os.name == 'nt':
+        # Windows cannot delete a file another process still maps, so the removal itself is the check
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_stale_spill_files(directory):
+    """Delete `gallery-<pid>.f32` files left behind by processes that died
+    without running `close()`. Returns the number removed."""
+    removed = 0
+    for name in os.listdir(directory):
+        match = SPILL_FILE.match(name)
+        if not match or int(match.group(1)) == os.getpid() or _process_alive(int(match.group(1))):
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+class Identity:
+    """Per-card bookkeeping. The card's rows are the ones whose `_owners`
+    entry is its slot, so nothing here grows with the number of encodings."""
+
+    __slots__ = ('card_id', 'enrolled_at')
+
+    def __init__(self, card_id, enrolled_at=None):
+        self.card_id = card_id
+        self.enrolled_at = enrolled_at or time.time()
+
+
+class QuantizedGallery:
+    """Memory-compact gallery with scalar-quantized encodings.
+
+    Encodings are held as float16 (256 bytes each) or int8 with a float32
+    per-vector scale (132 bytes each), against 512 bytes for float32. The
+    whole roster is searched on the quantized codes in fixed-size blocks,
+    and the `rerank` best candidates of each probe are re-scored against
+    full-precision copies before the final decision. Those copies live in a
+    memory-mapped spill file, so only the rows that are actually re-ranked
+    are paged in. Rows map to `Identity` records through an int32 array
+    rather than a per-row object array. With `rerank=1` nothing is
+    re-scored and distances come from the codes alone. Same interface as
+    FaceGallery.
+    """
+
+    BLOCK = 16384
+
+    def __init__(self, tolerance=0.45, quantization=None, rerank=None, capacity=256, spill_path=None):
+        self.tolerance = tolerance
+        self.quantization = quantization or os.getenv('GALLERY_QUANTIZATION', 'int8')
+        if self.quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization must be one of {', '.join(QUANTIZATIONS)}")
+        self.rerank = int(rerank or os.getenv('GALLERY_RERANK', 8))
+        self._codes = np.zeros((capacity, ENCODING_SIZE), dtype=self.quantization)
+        self._scales = np.ones(capacity, dtype=np.float32)
+        self._norms = np.zeros(capacity, dtype=np.float32)
+        self._owners = np.full(capacity, -1, dtype=np.int32)
+        self._identities = []
+        self._by_card = {}
+        self._free_slots = []
+        self._size = 0
+        if spill_path is None:
+            handle, spill_path = tempfile.mkstemp(prefix='gallery-', suffix='.f32')
+            os.close(handle)
+        self.spill_path = spill_path
+        self._full = self._map_spill(capacity)
+        self._lock = threading.Lock()
+
+    def _map_spill(self, capacity):
+        with open(self.spill_path, 'ab') as f:
+            f.truncate(capacity * ENCODING_SIZE * 4)
+        return np.memmap(self.spill_path, dtype=np.float32, mode='r+', shape=(capacity, ENCODING_SIZE))
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, card_id):
+        with self._lock:
+            return str(card_id) in self._by_card
+
+    def card_ids(self):
+        with self._lock:
+            return set(self._by_card)
+
+    def memory_bytes(self):
+        """Resident bytes of the search arrays plus `bookkeeping_bytes()`.
+
+        The spill file is excluded; the OS pages in only the rows re-ranked.
+        """
+        return (self._codes.nbytes + self._scales.nbytes + self._norms.nbytes + self._owners.nbytes
+                + self.bookkeeping_bytes())
+
+    def bookkeeping_bytes(self):
+        """Python-object overhead: Identity records, card id strings and the
+        lookup dict and lists; per card, not per encoding."""
+        with self._lock:
+            total = (sys.getsizeof(self._identities) + sys.getsizeof(self._by_card)
+                     + sys.getsizeof(self._free_slots))
+            for identity in self._identities:
+                if identity is None:
+                    continue
+                total += sys.getsizeof(identity) + sys.getsizeof(identity.card_id)
+            return total
+
+    def _quantize(self, encodings):
+        if self.quantization == 'float16':
+            codes = encodings.astype(np.float16)
+            scales = np.ones(len(encodings), dtype=np.float32)
+            decoded = codes.astype(np.float32)
+        else:
+            scales = np.abs(encodings).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.clip(np.rint(encodings / scales[:, None]), -127, 127).astype(np.int8)
+            decoded = codes.astype(np.float32) * scales[:, None]
+        return codes, scales.astype(np.float32), np.einsum('ij,ij->i', decoded, decoded)
+
+    def _grow(self, needed):
+        capacity = len(self._codes)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ('_codes', '_scales', '_norms', '_owners'):
+            old = getattr(self, name)
+            new = np.full((capacity,) + old.shape[1:], -1 if name == '_owners' else 0, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+        self._full.flush()
+        self._full = self._map_spill(capacity)
+
+    def _identity_slot(self, card_id):
+        slot = self._by_card.get(card_id)
+        if slot is None:
+            slot = self._free_slots.pop() if self._free_slots else len(self._identities)
+            if slot == len(self._identities):
+                self._identities.append(None)
+            self._identities[slot] = Identity(card_id)
+            self._by_card[card_id] = slot
+        return slot
+
+    def add_many(self, card_ids, encodings):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        codes, scales, norms = self._quantize(encodings)
+        with self._lock:
+            start = self._size
+            self._grow(start + len(encodings))
+            end = start + len(encodings)
+            self._codes[start:end] = codes
+            self._scales[start:end] = scales
+            self._norms[start:end] = norms
+            self._full[start:end] = encodings
+            for row, card_id in enumerate(card_ids, start=start):
+                self._owners[row] = self._identity_slot(str(card_id))
+            self._size = end
+
+    def add(self, card_id, encoding):
+        self.add_many([card_id], [encoding])
+
+    def remove(self, card_id):
+        """Drop every encoding of `card_id`, filling the holes from the tail."""
+        with self._lock:
+            slot = self._by_card.pop(str(card_id), None)
+            if slot is None:
+                return 0
+            self._identities[slot] = None
+            self._free_slots.append(slot)
+            rows = np.flatnonzero(self._owners[:self._size] == slot)
+            # Highest first, so the tail row moved into a hole never belongs to this card
+            for row in rows[::-1]:
+                last = self._size - 1
+                if row != last:
+                    self._codes[row] = self._codes[last]
+                    self._scales[row] = self._scales[last]
+                    self._norms[row] = self._norms[last]
+                    self._full[row] = self._full[last]
+                    self._owners[row] = self._owners[last]
+                self._owners[last] = -1
+                self._size -= 1
+            return len(rows)
+
+    def replace(self, card_id, encodings):
+        self.remove(card_id)
+        self.add_many([card_id] * len(encodings), encodings)
+
+    def _approximate(self, probes):
+        """Squared distances to every row from the quantized codes, block by block."""
+        probe_norms = np.einsum('ij,ij->i', probes, probes)
+        squared = np.empty((len(probes), self._size), dtype=np.float32)
+        for start in range(0, self._size, self.BLOCK):
+            end = min(start + self.BLOCK, self._size)
+            dots = probes @ self._codes[start:end].astype(np.float32).T
+            squared[:, start:end] = (probe_norms[:, None] + self._norms[None, start:end]
+                                     - 2.0 * dots * self._scales[None, start:end])
+        return squared
+
+    def match_batch(self, probes, tolerance=None):
+        tolerance = self.tolerance if tolerance is None else tolerance
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            if not self._size:
+                return [(None, None)] * len(probes)
+            squared = self._approximate(probes)
+            if self.rerank <= 1:
+                best = np.argmin(squared, axis=1)
+                distances = np.sqrt(np.maximum(squared[np.arange(len(probes)), best], 0.0))
+                results = []
+                for row, distance in zip(best, distances):
+                    card_id = self._identities[self._owners[row]].card_id
+                    results.append((card_id if distance <= tolerance else None, float(distance)))
+                return results
+            k = min(self.rerank, self._size)
+            candidates = np.argpartition(squared, k - 1, axis=1)[:, :k]
+            results = []
+            for probe, rows in zip(probes, candidates):
+                # Full-precision re-rank; only these rows of the spill file are read
+                rows = np.sort(rows)
+                distances = np.linalg.norm(self._full[rows] - probe, axis=1)
+                best = int(np.argmin(distances))
+                card_id = self._identities[self._owners[rows[best]]].card_id
+                distance = float(distances[best])
+                results.append((card_id if distance <= tolerance else None, distance))
+            return results
+
+    def match(self, probe, tolerance=None):
+        return self.match_batch([probe], tolerance)[0]
+
+    def close(self):
+        """Release and delete the spill file."""
+        with self._lock:
+            self._full = None
+        try:
+            os.remove(self.spill_path)
+        except OSError:
+            pass
@@ -0,0 +1,264 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+from detection import FaceDetector
+from liveness import LivenessChecker
+
+
+def iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    intersection = max(bottom - top, 0) * max(right - left, 0)
+    if not intersection:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return intersection / float(area_a + area_b - intersection)
+
+
+class Track:
+    """A face followed across frames together with its cached identity."""
+
+    def __init__(self, track_id, box, card_id=None, distance=None):
+        self.track_id = track_id
+        self.box = box
+        self.card_id = card_id
+        self.distance = distance
+        self.encoding = None
+        self.encoded_at = None
+        # Consecutive encodings that produced the same card id (or None)
+        self.streak = 0
+        self.misses = 0
+        # Liveness verdict: True, False (spoof) or None (undecided)
+        self.live = None
+        # Downscaled grayscale face patch from the last detection, and its scale
+        self.template = None
+        self.template_scale = None
+
+
+class RecognitionScheduler:
+    """Runs the full detect + encode + match pipeline only when needed.
+
+    Every frame falls into one of three tiers:
+
+    * keyframe (every `keyframe_interval` frames, on a scene change or
+      right after a track was lost): detect, associate the boxes with the
+      tracks by IoU, then encode and match every face;
+    * static scene: nothing moved and no face is being followed, so there
+      is nothing to do;
+    * otherwise: no detector. Each track is followed by matching the face
+      patch saved at its last detection (downscaled to `track_size` pixels)
+      inside a window around its previous box, and keeps its cached
+      identity. A track whose best match scores under `track_threshold`
+      counts as a miss and forces a keyframe on the next frame.
+
+    Faces that appear between keyframes are picked up by the next one. A
+    track that goes unmatched for `max_misses` frames is dropped.
+
+    A track is re-encoded on every frame until `confirm_encodings`
+    consecutive encodings agree on its identity, known or unknown, so a
+    ResultCoalescer with the same count confirms it within that many
+    frames rather than that many keyframes. After that it keeps its cached
+    identity until the next keyframe.
+
+    Before anything is encoded, each track's face goes through `liveness`
+    (see liveness.py); spoofs and undecided tracks are never encoded.
+
+    With `gallery=None` faces are encoded but not matched; callers read
+    `track.encoding` for tracks whose `encoded_at` equals `frames` and match
+    them elsewhere (see cameras.py).
+    """
+
+    def __init__(self, gallery, detector=None, keyframe_interval=None, liveness=None,
+                 scene_change_threshold=25.0, still_threshold=2.0, iou_threshold=0.3, max_misses=3,
+                 track_size=32, track_margin=0.5, track_threshold=0.5, confirm_encodings=None):
+        self.gallery = gallery
+        self.detector = detector or FaceDetector()
+        self.liveness = liveness or LivenessChecker()
+        self.keyframe_interval = int(keyframe_interval or os.getenv('RECOGNITION_KEYFRAME_INTERVAL', 10))
+        self.scene_change_threshold = scene_change_threshold
+        self.still_threshold = still_threshold
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.track_size = track_size
+        self.track_margin = track_margin
+        self.track_threshold = track_threshold
+        self.confirm_encodings = int(confirm_encodings or os.getenv('MATCH_CONFIRM_FRAMES', 3))
+        self.tracks = []
+        self.keyframes = 0
+        self.frames = 0
+        # Seconds spent in each stage that ran on the last processed frame
+        self.stage_times = {}
+        self._next_track_id = 0
+        self._since_keyframe = 0
+        self._thumbnail = None
+
+    def _scene_delta(self, gray):
+        """Mean thumbnail difference from the last frame that was not skipped as static.
+
+        Comparing against that frame rather than the previous one keeps slow
+        movement from being skipped forever.
+        """
+        thumbnail = cv2.resize(gray, (64, 48), interpolation=cv2.INTER_AREA).astype(np.int16)
+        if self._thumbnail is None:
+            return float('inf'), thumbnail
+        return float(np.mean(np.abs(thumbnail - self._thumbnail))), thumbnail
+
+    def _identify(self, rgb_frame, boxes):
+        if not boxes:
+            return [], []
+        started = time.perf_counter()
+        encodings = self.detector.encode(rgb_frame, boxes)
+        self.stage_times['encode'] = time.perf_counter() - started
+        if self.gallery is None or not encodings:
+            return encodings, [(None, None)] * len(encodings)
+        started = time.perf_counter()
+        matches = self.gallery.match_batch(encodings)
+        self.stage_times['match'] = time.perf_counter() - started
+        return encodings, matches
+
+    def _new_track(self, box, card_id, distance):
+        self._next_track_id += 1
+        return Track(self._next_track_id, box, card_id, distance)
+
+    def _associate(self, boxes):
+        """Greedy IoU matching; returns ({box index: track}, unmatched box indexes)."""
+        pairs = sorted(((iou(track.box, box), i, track)
+                        for i, box in enumerate(boxes) for track in self.tracks),
+                       key=lambda pair: pair[0], reverse=True)
+        matched, used = {}, set()
+        for overlap, i, track in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if i in matched or id(track) in used:
+                continue
+            matched[i] = track
+            used.add(id(track))
+        return matched, [i for i in range(len(boxes)) if i not in matched]
+
+    def _set_template(self, track, gray):
+        top, right, bottom, left = track.box
+        scale = self.track_size / max(right - left, bottom - top, 1)
+        patch = gray[top:bottom, left:right]
+        if not patch.size:
+            track.template = None
+            return
+        track.template = cv2.resize(patch, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        track.template_scale = scale
+
+    def _follow(self, track, gray):
+        """The track's box moved to where its template matches best, or None if lost."""
+        if track.template is None:
+            return None
+        top, right, bottom, left = track.box
+        height, width = bottom - top, right - left
+        frame_height, frame_width = gray.shape[:2]
+        margin_y, margin_x = int(height * self.track_margin), int(width * self.track_margin)
+        window_top, window_left = max(top - margin_y, 0), max(left - margin_x, 0)
+        window = gray[window_top:min(bottom + margin_y, frame_height), window_left:min(right + margin_x, frame_width)]
+        scale = track.template_scale
+        window = cv2.resize(window, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if window.shape[0] < track.template.shape[0] or window.shape[1] < track.template.shape[1]:
+            return None
+        scores = cv2.matchTemplate(window, track.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (x, y) = cv2.minMaxLoc(scores)
+        if not score >= self.track_threshold:
+            return None
+        top = min(window_top + int(round(y / scale)), frame_height - height)
+        left = min(window_left + int(round(x / scale)), frame_width - width)
+        return (top, left + width, top + height, left)
+
+    def _detect_tracks(self, rgb_frame, gray):
+        started = time.perf_counter()
+        boxes = self.detector.detect(rgb_frame)
+        self.stage_times['detect'] = time.perf_counter() - started
+        matched, _ = self._associate(boxes)
+
+        tracks = []
+        for i, box in enumerate(boxes):
+            track = matched.get(i)
+            if track is None:
+                track = self._new_track(box, None, None)
+            else:
+                track.box, track.misses = box, 0
+            self._set_template(track, gray)
+            tracks.append(track)
+        return tracks
+
+    def _follow_tracks(self, gray):
+        started = time.perf_counter()
+        tracks = []
+        for track in self.tracks:
+            if track.misses:
+                continue
+            box = self._follow(track, gray)
+            if box is None:
+                # Lost; the next frame re-detects so the face can be picked up again
+                self._since_keyframe = self.keyframe_interval
+                continue
+            track.box = box
+            tracks.append(track)
+        self.stage_times['track'] = time.perf_counter() - started
+        return tracks
+
+    def process(self, frame):
+        """Update tracks from a BGR frame and return the faces visible in it."""
+        self.frames += 1
+        self._since_keyframe += 1
+        self.stage_times = {}
+        # `frame` may be a ring buffer slot the capture thread overwrites
+        # while detection runs, so everything below works on these copies
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        gray = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+        delta, thumbnail = self._scene_delta(gray)
+
+        keyframe = self._since_keyframe >= self.keyframe_interval or delta >= self.scene_change_threshold
+        # Following a face is cheap, and a small face can drift well below the
+        # whole-frame threshold, so only empty scenes are skipped
+        following = any(not track.misses for track in self.tracks)
+        if not keyframe and delta < self.still_threshold and not following:
+            return []
+        self._thumbnail = thumbnail
+
+        tracks = self._detect_tracks(rgb_frame, gray) if keyframe else self._follow_tracks(gray)
+
+        if self.liveness.enabled:
+            started = time.perf_counter()
+            for track in tracks:
+                track.live = self.liveness.update(track.track_id, gray, rgb_frame, track.box)
+                if track.live is False:
+                    track.card_id, track.distance, track.streak = None, None, 0
+            self.stage_times['liveness'] = time.perf_counter() - started
+        else:
+            for track in tracks:
+                track.live = True
+
+        if keyframe:
+            self.keyframes += 1
+            self._since_keyframe = 0
+        # New tracks, tracks that just turned live and tracks whose identity is
+        # not settled yet are identified right away; the rest keep their
+        # cached identity until the next keyframe
+        to_identify = [track for track in tracks
+                       if track.live and (keyframe or track.streak < self.confirm_encodings)]
+        encodings, matches = self._identify(rgb_frame, [track.box for track in to_identify])
+        for track, encoding, (card_id, distance) in zip(to_identify, encodings, matches):
+            settled = track.encoded_at is not None and card_id == track.card_id
+            track.streak = track.streak + 1 if settled else 1
+            track.card_id, track.distance = card_id, distance
+            track.encoding, track.encoded_at = encoding, self.frames
+
+        # Keep briefly occluded tracks around so their identity survives a missed detection
+        seen = {id(track) for track in tracks}
+        for track in self.tracks:
+            if id(track) not in seen:
+                track.misses += 1
+                if track.misses < self.max_misses:
+                    tracks.append(track)
+        self.tracks = tracks
+        self.liveness.prune(track.track_id for track in tracks)
+        return [track for track in tracks if not track.misses]
@@ -0,0 +1,159 @@
+"""Recognition worker: the camera, tracker and encoder outside the web tier.
+
+The worker opens CAMERA_SOURCE (default 0, 'none' for registry cameras
+only) plus any `id=source` pairs in CAMERA_SOURCES, runs recognition
+continuously and emits results and frames like the single-process server
+does. Events reach browsers one of two ways:
+
+* through SOCKETIO_MESSAGE_QUEUE (Redis), when the worker runs on its own
+  (`python serve.py --role worker`) next to any number of web replicas;
+* through a multiprocessing queue relayed by the web process that spawned
+  it, when no message queue is configured (`python serve.py --role web`).
+
+New enrollments are written by the web tier; the worker reloads the
+encoding store whenever its manifest changes. Frames that clients push to
+the web tier (/api/frames, `submit_frame`) are forwarded the same way and
+recognised here.
+
+The worker's own metrics (recognition stage timings, capture counters) are
+prefixed `smartglass_worker`. A spawned worker forwards them to its parent,
+whose /metrics includes them; a standalone worker serves them itself on
+WORKER_METRICS_PORT (default 9101).
+"""
+import os
+import queue
+import signal
+import threading
+import time
+
+
+GALLERY_RELOAD_INTERVAL = float(os.getenv('GALLERY_RELOAD_INTERVAL', 5))
+METRICS_FORWARD_INTERVAL = float(os.getenv('METRICS_FORWARD_INTERVAL', 5))
+WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', 9101))
+
+
+class QueueEmitter:
+    """Stands in for `socketio` in a worker, forwarding emits to its parent."""
+
+    def __init__(self, events):
+        self.events = events
+        self.dropped = 0
+
+    def emit(self, event, data=None, to=None, skip_sid=None, callback=None, **kwargs):
+        try:
+            self.events.put_nowait((event, data, to, skip_sid))
+        except queue.Full:
+            self.dropped += 1  # the parent is behind; later frames and results supersede this one
+
+
+def relay_events(socketio, events, stream_hub=None, metrics=None):
+    """Emit everything a spawned worker puts on `events`; runs in the web process.
+
+    Camera frames go through `stream_hub` instead, so that the web process,
+    which holds the connections, applies per-client acknowledgements, and
+    the worker's rendered metrics are handed to the `metrics` registry.
+    """
+    while True:
+        try:
+            event, data, to, skip_sid = events.get(timeout=1.0)
+        except queue.Empty:
+            continue
+        except (EOFError, OSError):
+            return
+        try:
+            if event == 'camera_frame' and stream_hub is not None:
+                stream_hub.publish(data['image'], data['seq'], data['width'], data['height'])
+                continue
+            if event == 'worker_metrics':
+                if metrics is not None:
+                    metrics.include('worker', data)
+                continue
+            socketio.emit(event, data, to=to, skip_sid=skip_sid)
+        except Exception as e:
+            print(f"[ERROR] Relaying {event} failed: {e}")
+
+
+def parse_camera_sources(value):
+    """`lab=0,gate=rtsp://...` -> [('lab', '0'), ('gate', 'rtsp://...')]"""
+    sources = []
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        camera_id, _, source = item.partition('=')
+        sources.append((camera_id, source) if source else (None, camera_id))
+    return sources
+
+
+def watch_gallery(server, stop_event):
+    # Baseline is the manifest the warm-up loaded, not whatever the first poll finds
+    manifest_mtime = server.startup.get('manifest_mtime')
+    while not stop_event.wait(GALLERY_RELOAD_INTERVAL):
+        mtime = server.encoding_store.manifest_mtime()
+        if mtime is None:
+            continue
+        if mtime != manifest_mtime:
+            changed = server.template_bank.sync(server.encoding_store.entries())
+            print(f"[DEBUG] Recognition worker: reloaded gallery, {changed} cards changed")
+        manifest_mtime = mtime
+
+
+def forward_metrics(registry, events, stop_event):
+    while not stop_event.wait(METRICS_FORWARD_INTERVAL):
+        try:
+            events.put(('worker_metrics', registry.render(), None, None), timeout=1.0)
+        except queue.Full:
+            pass
+
+
+def run_worker(events=None, commands=None, frames=None):
+    """Entry point of the worker process; blocks until SIGTERM or SIGINT."""
+    import app as server
+    from ingest import FrameChannel
+    from metrics import start_http_server
+    from student_cache import InvalidationChannel
+
+    # Keep the worker's series apart from the web process's in one scrape
+    server.metrics.prefix = 'smartglass_worker'
+    server.create_app('worker')
+    while not server.ready.wait(timeout=1.0):
+        if server.startup['error']:
+            raise SystemExit(f"Recognition worker: warm-up failed: {server.startup['error']}")
+    if events is not None:
+        server.emitter = QueueEmitter(events)
+        server.stream_hub.socketio = server.emitter
+    # Stream clients are connected to the web tier, which the worker cannot see
+    server.stream_hub.mode = 'raw' if events is not None else 'rooms'
+    if commands is not None:
+        threading.Thread(target=InvalidationChannel(commands=commands).listen,
+                         args=(server.student_cache.invalidate,), daemon=True).start()
+    if frames is not None:
+        threading.Thread(target=FrameChannel(frames=frames).listen,
+                         args=(server.frame_ingest.submit,), daemon=True).start()
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    threading.Thread(target=watch_gallery, args=(server, stop_event), daemon=True).start()
+    if events is not None:
+        threading.Thread(target=forward_metrics, args=(server.metrics, events, stop_event), daemon=True).start()
+    else:
+        start_http_server(server.metrics, WORKER_METRICS_PORT)
+
+    source = os.getenv('CAMERA_SOURCE', '0')
+    if source.lower() != 'none':
+        if not server.open_camera({'source': source}):
+            raise SystemExit(f"Recognition worker: cannot open camera {source}")
+        server.start_recognition()
+    for camera_id, camera_source in parse_camera_sources(os.getenv('CAMERA_SOURCES', '')):
+        server.add_registry_camera(camera_source, camera_id=camera_id)
+    print(f"[DEBUG] Recognition worker started (pid {os.getpid()})")
+
+    try:
+        while not stop_event.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.recognition_running = False
+        server.stop_camera = True
+        if server.camera is not None:
+            time.sleep(server.recognition_interval)
+            server.camera.stop()
+        server.camera_registry.stop_all()
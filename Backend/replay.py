@@ -0,0 +1,217 @@
+"""Offline replay of recorded video through the recognition pipeline.
+
+ReplaySource stands in for `cv2.VideoCapture`, so a recording can be fed to
+CaptureThread (and so to the live server) or benchmarked directly:
+
+    python replay.py clip.mp4 --truth clip.csv --fast --json report.json
+
+The ground-truth file is a CSV of `frame,card_id` rows (frame indexes start
+at 0; one row per person visible in the frame). The benchmark reports
+frames/sec, per-stage latency percentiles and match precision/recall.
+
+Enrollments are read from the server's encoding store without modifying
+it, or with --images encoded from a directory into a throwaway store, and
+go through the same TemplateBank as the server.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from encoding_store import IMAGE_EXTENSIONS
+
+
+class ReplaySource:
+    """VideoCapture-compatible reader over a video file or a frame directory.
+
+    With `realtime=True` frames are released at the recording's frame rate;
+    otherwise `read()` returns them as fast as they can be decoded.
+    """
+
+    def __init__(self, path, realtime=True, fps=None, loop=False):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.frame_index = -1
+        self._started = None
+        if os.path.isdir(path):
+            self._files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                                 if name.lower().endswith(IMAGE_EXTENSIONS))
+            self._video = None
+            self.fps = float(fps or 25)
+        else:
+            self._files = None
+            self._video = cv2.VideoCapture(path)
+            self.fps = float(fps or self._video.get(cv2.CAP_PROP_FPS) or 25)
+
+    def isOpened(self):
+        return bool(self._files) if self._video is None else self._video.isOpened()
+
+    def _rewind(self):
+        self.frame_index = -1
+        self._started = None
+        if self._video is not None:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def _next_frame(self, image):
+        if self._video is not None:
+            return self._video.read(image) if image is not None else self._video.read()
+        index = self.frame_index + 1
+        if index >= len(self._files):
+            return False, None
+        frame = cv2.imread(self._files[index])
+        return frame is not None, frame
+
+    def read(self, image=None):
+        success, frame = self._next_frame(image)
+        if not success and self.loop and self.frame_index >= 0:
+            self._rewind()
+            success, frame = self._next_frame(image)
+        if not success:
+            return False, None
+        self.frame_index += 1
+
+        if self.realtime:
+            if self._started is None:
+                self._started = time.monotonic()
+            delay = self._started + self.frame_index / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return True, frame
+
+    def release(self):
+        if self._video is not None:
+            self._video.release()
+
+
+def load_ground_truth(path):
+    truth = defaultdict(set)
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip().isdigit():
+                continue  # header or blank line
+            if len(row) > 1 and row[1].strip():
+                truth[int(row[0])].add(row[1].strip())
+    return truth
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    values = np.array(samples) * 1000.0
+    return {
+        'count': len(samples),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p90_ms': round(float(np.percentile(values, 90)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def run_benchmark(source, recognizer, truth=None, max_frames=None):
+    """Feed every frame of `source` through `recognizer` and collect stats."""
+    samples = defaultdict(list)
+    predictions = {}
+    started = time.perf_counter()
+    while max_frames is None or len(predictions) < max_frames:
+        read_started = time.perf_counter()
+        success, frame = source.read()
+        if not success:
+            break
+        samples['capture'].append(time.perf_counter() - read_started)
+
+        frame_started = time.perf_counter()
+        tracks = recognizer.process(frame)
+        samples['total'].append(time.perf_counter() - frame_started)
+        for stage, seconds in recognizer.stage_times.items():
+            samples[stage].append(seconds)
+        predictions[source.frame_index] = {track.card_id for track in tracks if track.card_id is not None}
+    elapsed = time.perf_counter() - started
+
+    report = {
+        'source': source.path,
+        'frames': len(predictions),
+        'keyframes': recognizer.keyframes,
+        'liveness': {'strictness': recognizer.liveness.strictness,
+                     'rejected_frames': recognizer.liveness.rejected},
+        'elapsed_s': round(elapsed, 3),
+        'fps': round(len(predictions) / elapsed, 2) if elapsed else None,
+        'stages': {stage: percentiles(values) for stage, values in samples.items()},
+    }
+    if truth is not None:
+        true_positives = false_positives = false_negatives = 0
+        for frame_index, predicted in predictions.items():
+            expected = truth.get(frame_index, set())
+            true_positives += len(predicted & expected)
+            false_positives += len(predicted - expected)
+            false_negatives += len(expected - predicted)
+        predicted_total = true_positives + false_positives
+        expected_total = true_positives + false_negatives
+        report['accuracy'] = {
+            'true_positives': true_positives,
+            'false_positives': false_positives,
+            'false_negatives': false_negatives,
+            'precision': round(true_positives / predicted_total, 4) if predicted_total else None,
+            'recall': round(true_positives / expected_total, 4) if expected_total else None,
+        }
+    return report
+
+
+def main():
+    import shutil
+    import tempfile
+
+    from encoding_store import EncodingStore
+    from enrollment import encode_image_file
+    from gallery import FaceGallery, TemplateBank
+    from liveness import STRICTNESS_LEVELS, LivenessChecker
+    from recognition import RecognitionScheduler
+
+    parser = argparse.ArgumentParser(description='Replay a recording through the recognition pipeline.')
+    parser.add_argument('source', help='video file or directory of frames')
+    parser.add_argument('--truth', help='ground-truth CSV of frame,card_id rows')
+    parser.add_argument('--fast', action='store_true', help='process frames as fast as possible')
+    parser.add_argument('--fps', type=float, help='override the recording frame rate')
+    parser.add_argument('--max-frames', type=int, help='stop after this many frames')
+    parser.add_argument('--store', default=os.getenv('ENCODING_STORE', 'encodings'),
+                        help='encoding store to read enrollments from (never written)')
+    parser.add_argument('--images', help='encode this image directory instead of reading --store')
+    parser.add_argument('--liveness', choices=STRICTNESS_LEVELS,
+                        help='liveness strictness (default: LIVENESS_STRICTNESS)')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    gallery = FaceGallery(tolerance=0.45)
+    template_bank = TemplateBank(gallery)
+    if args.images:
+        scratch = tempfile.mkdtemp(prefix='replay-store-')
+        try:
+            template_bank.load(EncodingStore(scratch).sync(args.images, encode_image_file))
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+    else:
+        template_bank.load(EncodingStore(args.store).entries())
+
+    source = ReplaySource(args.source, realtime=not args.fast, fps=args.fps)
+    if not source.isOpened():
+        parser.error(f'Cannot open {args.source}')
+    truth = load_ground_truth(args.truth) if args.truth else None
+    report = run_benchmark(source, RecognitionScheduler(gallery, liveness=LivenessChecker(args.liveness)),
+                           truth, args.max_frames)
+    source.release()
+
+    report['gallery_size'] = len(gallery)
+    report['enrolled_cards'] = len(template_bank.card_ids())
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""Bulk student import.
+
+Rows stream from a CSV (with a header row) or JSON Lines file, are
+validated one by one and inserted in chunked bulk transactions. A bad row
+is reported with its line number and never rolls back the rest of the
+file. Usable from `POST /api/students/import` or directly:
+
+    python roster.py students.csv --chunk-size 1000
+
+Columns: Name, Reg_No, DOB (YYYY-MM-DD), Blood_Group, Phone, Dept, Gender,
+Remarks and optionally id (the card number), Organization, Performance.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import create_engine, MetaData
+from sqlalchemy.exc import IntegrityError
+
+
+# column -> (required, max length); None means not a string column
+STUDENT_COLUMNS = {
+    'id': (False, None),
+    'Name': (True, 20),
+    'Reg_No': (True, 10),
+    'DOB': (True, None),
+    'Blood_Group': (True, 5),
+    'Phone': (True, 10),
+    'Dept': (True, 10),
+    'Gender': (True, 10),
+    'Organization': (False, 100),
+    'Performance': (False, 100),
+    'Remarks': (False, 100),
+}
+UNIQUE_COLUMNS = ('id', 'Reg_No', 'Phone')
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, dict) from a binary stream of CSV or JSONL.
+
+    Invalid JSON lines are yielded as the ValueError to report.
+    """
+    stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, ValueError(f'Invalid JSON: {e}')
+                continue
+            yield line_no, row if isinstance(row, dict) else ValueError('Each line must be a JSON object')
+
+
+def validate_student(row, now=None):
+    """Column values for one student row; raises ValueError with every problem found."""
+    if isinstance(row, Exception):
+        raise row
+    values, problems = {}, []
+    for column, (required, max_length) in STUDENT_COLUMNS.items():
+        value = row.get(column)
+        value = value.strip() if isinstance(value, str) else value
+        if value in (None, ''):
+            if required:
+                problems.append(f'{column} is required')
+            elif column != 'id':
+                values[column] = ''
+            continue
+        if column == 'id':
+            if not str(value).isdigit():
+                problems.append('id must be a positive integer')
+            else:
+                values['id'] = int(value)
+        elif column == 'DOB':
+            try:
+                values['DOB'] = datetime.strptime(str(value), '%Y-%m-%d').date()
+            except ValueError:
+                problems.append('DOB must be YYYY-MM-DD')
+        elif len(str(value)) > max_length:
+            problems.append(f'{column} is longer than {max_length} characters')
+        else:
+            values[column] = str(value)
+    if problems:
+        raise ValueError('; '.join(problems))
+    values['Name'] = values['Name'].upper()
+    values['Created_At'] = now or datetime.utcnow()
+    return values
+
+
+class StudentImporter:
+    """Inserts validated rows into `table` in chunks of `chunk_size`.
+
+    Each chunk is checked against the database for duplicate ids, Reg_No
+    and Phone first, so the common failures become per-row errors without
+    a failed transaction. If the bulk insert still hits a constraint (a
+    concurrent insert), that chunk is retried row by row.
+    `on_inserted(rows)` is called after every committed chunk.
+    """
+
+    def __init__(self, engine, table, chunk_size=None, on_inserted=None, max_errors=1000):
+        self.engine = engine
+        self.table = table
+        self.chunk_size = int(chunk_size or os.getenv('IMPORT_CHUNK_SIZE', 1000))
+        self.on_inserted = on_inserted
+        self.max_errors = max_errors
+        self.summary = {'total': 0, 'inserted': 0, 'failed': 0, 'errors': []}
+
+    def _error(self, line_no, message):
+        self.summary['failed'] += 1
+        if len(self.summary['errors']) < self.max_errors:
+            self.summary['errors'].append({'line': line_no, 'error': message})
+
+    def _drop_duplicates(self, chunk, connection):
+        seen = {column: set() for column in UNIQUE_COLUMNS}
+        for column in UNIQUE_COLUMNS:
+            wanted = [values[column] for _, values in chunk if column in values]
+            if wanted:
+                seen[column].update(value for (value,) in connection.execute(
+                    self.table.select().with_only_columns(self.table.c[column])
+                    .where(self.table.c[column].in_(wanted))))
+        kept = []
+        for line_no, values in chunk:
+            duplicate = next((column for column in UNIQUE_COLUMNS
+                              if column in values and values[column] in seen[column]), None)
+            if duplicate:
+                self._error(line_no, f'{duplicate} {values[duplicate]} already exists')
+                continue
+            for column in UNIQUE_COLUMNS:
+                if column in values:
+                    seen[column].add(values[column])
+            kept.append((line_no, values))
+        return kept
+
+    def _insert(self, chunk):
+        with self.engine.connect() as connection:
+            chunk = self._drop_duplicates(chunk, connection)
+        if not chunk:
+            return
+        # Rows with and without an explicit id need separate executemany batches
+        batches = [[values for _, values in chunk if 'id' in values],
+                   [values for _, values in chunk if 'id' not in values]]
+        try:
+            with self.engine.begin() as connection:
+                for rows in batches:
+                    if rows:
+                        connection.execute(self.table.insert(), rows)
+            inserted = [values for _, values in chunk]
+        except IntegrityError:
+            inserted = []
+            for line_no, values in chunk:
+                try:
+                    with self.engine.begin() as connection:
+                        connection.execute(self.table.insert(), [values])
+                    inserted.append(values)
+                except IntegrityError as e:
+                    self._error(line_no, f'Duplicate or invalid row: {e.orig}')
+        self.summary['inserted'] += len(inserted)
+        if inserted and self.on_inserted is not None:
+            self.on_inserted(inserted)
+
+    def run(self, rows):
+        """Import (line number, row) pairs and return the summary."""
+        chunk = []
+        now = datetime.utcnow()
+        for line_no, row in rows:
+            self.summary['total'] += 1
+            try:
+                chunk.append((line_no, validate_student(row, now)))
+            except ValueError as e:
+                self._error(line_no, str(e))
+            if len(chunk) >= self.chunk_size:
+                self._insert(chunk)
+                chunk = []
+        if chunk:
+            self._insert(chunk)
+        return self.summary
+
+
+def import_format(filename, declared=None):
+    fmt = (declared or os.path.splitext(filename or '')[1].lstrip('.')).lower()
+    if fmt in ('jsonl', 'ndjson', 'json'):
+        return 'jsonl'
+    if fmt == 'csv':
+        return 'csv'
+    raise ValueError('Import format must be csv or jsonl')
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Bulk import students from CSV or JSON Lines.')
+    parser.add_argument('source', help='CSV (with header) or .jsonl file')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='default: from the file extension')
+    parser.add_argument('--database', default=os.getenv('DATABASE_URL'), help='default: DATABASE_URL')
+    parser.add_argument('--chunk-size', type=int, default=None, help='rows per transaction')
+    args = parser.parse_args()
+    if not args.database:
+        parser.error('DATABASE_URL is not set')
+
+    engine = create_engine(args.database)
+    metadata = MetaData()
+    metadata.reflect(engine, only=['student'])
+    started = datetime.utcnow()
+    with open(args.source, 'rb') as f:
+        summary = StudentImporter(engine, metadata.tables['student'], chunk_size=args.chunk_size).run(
+            read_rows(f, import_format(args.source, args.format)))
+    for error in summary['errors']:
+        print(f"[ERROR] line {error['line']}: {error['error']}")
+    elapsed = (datetime.utcnow() - started).total_seconds()
+    print(f"Imported {summary['inserted']} of {summary['total']} rows in {elapsed:.1f}s, "
+          f"{summary['failed']} failed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Production entry point.
+
+    python serve.py --role all       # one process: web server, camera, recognition
+    python serve.py --role web       # web tier; camera and recognition in a worker
+    python serve.py --role worker    # recognition worker only
+
+The app is built exactly once per process, without the debugger or the
+reloader. SOCKETIO_ASYNC_MODE selects 'threading' (default), 'eventlet' or
+'gevent'; the latter two must be installed and are monkey-patched before
+anything else is imported.
+
+With SOCKETIO_MESSAGE_QUEUE set (e.g. redis://localhost:6379/0), `--role
+web` replicas can be scaled out behind a load balancer with sticky
+sessions, fed by a single `--role worker`. Without it, `--role web` spawns
+one worker process itself and relays its events through a multiprocessing
+queue. The relay is meant for threading mode; with eventlet or gevent use
+a message queue. Under gunicorn, `serve:wsgi_app()` builds the web role.
+In web mode /api/capture-image is unavailable, because the camera belongs
+to the worker; /api/assign-image still enrolls.
+"""
+import time
+
+STARTED_AT = time.time()
+
+import argparse
+import os
+import socket
+
+ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', ASYNC_MODE)
+
+import multiprocessing
+import threading
+
+
+def start_worker_process():
+    """Spawn a recognition worker that reports back through a queue."""
+    from recognition_worker import relay_events, run_worker
+    from ingest import FrameChannel
+    from student_cache import InvalidationChannel
+    import app as server
+
+    context = multiprocessing.get_context('spawn')
+    events = context.Queue(maxsize=256)
+    # The other direction: student changes made here reach the worker's cache
+    commands = context.Queue()
+    server.student_cache_channel = InvalidationChannel(commands=commands)
+    # Frames pushed by clients are recognised by the worker too
+    frames = context.Queue(maxsize=64)
+    server.client_frame_channel = FrameChannel(frames=frames)
+    worker = context.Process(target=run_worker, args=(events, commands, frames), name='recognition-worker',
+                             daemon=True)
+    worker.start()
+    threading.Thread(target=relay_events, args=(server.socketio, events, server.stream_hub, server.metrics),
+                     daemon=True).start()
+    return worker
+
+
+def build(role):
+    import app as server
+
+    # Count startup from this process's first line, not from app.py's import
+    server.startup['started_at'] = STARTED_AT
+    server.create_app(role)
+    if role == 'web' and not os.getenv('SOCKETIO_MESSAGE_QUEUE'):
+        start_worker_process()
+    return server
+
+
+def wsgi_app():
+    return build('web').app
+
+
+def record_serving(server, role, host, port, timeout=60.0):
+    """Record startup['serving_s'] once the port accepts connections."""
+    probe_host = {'0.0.0.0': '127.0.0.1', '::': '::1', '': '127.0.0.1'}.get(host, host)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((probe_host, port), timeout=0.5).close()
+        except OSError:
+            time.sleep(0.01)
+            continue
+        server.startup['serving_s'] = round(time.time() - STARTED_AT, 3)
+        print(f"[DEBUG] Serving {role} role on {host}:{port} ({server.socketio.async_mode}) "
+              f"{server.startup['serving_s']}s after start")
+        return
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the Smart Glass backend.')
+    parser.add_argument('--role', choices=('all', 'web', 'worker'), default=os.getenv('SERVER_ROLE', 'all'))
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', 5000)))
+    args = parser.parse_args()
+
+    if args.role == 'worker':
+        if not os.getenv('SOCKETIO_MESSAGE_QUEUE'):
+            parser.error('a standalone worker needs SOCKETIO_MESSAGE_QUEUE; '
+                         'use --role web to run one with an in-process relay')
+        from recognition_worker import run_worker
+        run_worker()
+        return
+
+    server = build(args.role)
+    # Models and the gallery are still warming up in the background; /readyz reports when they are done
+    threading.Thread(target=record_serving, args=(server, args.role, args.host, args.port), daemon=True).start()
+    # Werkzeug is only used in threading mode; eventlet and gevent bring their own servers
+    server.socketio.run(server.app, host=args.host, port=args.port, debug=False, use_reloader=False,
+                        log_output=False, allow_unsafe_werkzeug=ASYNC_MODE == 'threading')
+
+
+if __name__ == '__main__':
+    main()
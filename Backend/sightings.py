@@ -0,0 +1,97 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+
+class SightingWriter:
+    """Background writer that batches sighting rows into bulk inserts.
+
+    `record()` only enqueues, so the recognition loop never waits on the
+    database. The writer thread flushes with one executemany-style insert
+    whenever `batch_size` rows are pending or `flush_interval` seconds have
+    passed. If the queue is full, new rows are dropped and counted. A batch
+    the database rejects is retried row by row, so one bad row (e.g. a
+    student deleted meanwhile) only costs itself.
+    """
+
+    def __init__(self, app, db, table, batch_size=None, flush_interval=None, max_queue=10000):
+        self.app = app
+        self.db = db
+        self.table = table
+        self.batch_size = int(batch_size or os.getenv('SIGHTING_BATCH_SIZE', 100))
+        self.flush_interval = float(flush_interval or os.getenv('SIGHTING_FLUSH_INTERVAL', 2))
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._running = False
+        self._thread = None
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def record(self, student_id, source, distance=None, camera_id=None, seen_at=None):
+        """Queue a sighting; `seen_at` is UTC. Non-numeric ids are dropped."""
+        try:
+            student_id = int(student_id)
+        except (TypeError, ValueError):
+            self.dropped += 1
+            return
+        row = {
+            'student_id': student_id,
+            'source': source,
+            'distance': distance,
+            'camera_id': camera_id,
+            'seen_at': seen_at or datetime.utcnow(),
+        }
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _flush(self, rows):
+        with self.app.app_context():
+            try:
+                with self.db.engine.begin() as connection:
+                    connection.execute(self.table.insert(), rows)
+                self.written += len(rows)
+                return
+            except Exception as e:
+                print(f"[ERROR] Failed to write {len(rows)} sightings, retrying one by one: {e}")
+            for row in rows:
+                try:
+                    with self.db.engine.begin() as connection:
+                        connection.execute(self.table.insert(), [row])
+                    self.written += 1
+                except Exception as e:
+                    self.dropped += 1
+                    print(f"[ERROR] Dropped sighting of {row['student_id']}: {e}")
+
+    def _run(self):
+        rows = []
+        deadline = time.monotonic() + self.flush_interval
+        while self._running or not self._queue.empty():
+            try:
+                rows.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0.05)))
+            except queue.Empty:
+                pass
+            if rows and (len(rows) >= self.batch_size or time.monotonic() >= deadline or not self._running):
+                self._flush(rows)
+                rows = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+        if rows:
+            self._flush(rows)
@@ -0,0 +1,156 @@
+import base64
+import os
+import threading
+import time
+
+import cv2
+
+
+class StreamSettings:
+    """Resolution, JPEG quality and frame rate of the camera stream.
+
+    `width` of 0 keeps the native camera resolution.
+    """
+
+    def __init__(self, width=None, quality=None, fps=None, max_pending=None):
+        self.width = int(width if width is not None else os.getenv('STREAM_WIDTH', 640))
+        self.quality = int(quality if quality is not None else os.getenv('STREAM_QUALITY', 70))
+        self.fps = float(fps if fps is not None else os.getenv('STREAM_FPS', 10))
+        self.max_pending = int(max_pending if max_pending is not None else os.getenv('STREAM_MAX_PENDING', 2))
+
+    def update(self, options):
+        """Apply `options`; raises ValueError without changing anything on bad input."""
+        values = {}
+        for key, cast in (('width', int), ('quality', int), ('fps', float)):
+            if options.get(key) is not None:
+                try:
+                    values[key] = cast(options[key])
+                except (TypeError, ValueError):
+                    raise ValueError(f'{key} must be a number')
+        if values.get('width', 0) < 0:
+            raise ValueError('width must be 0 (native) or positive')
+        for key, value in values.items():
+            setattr(self, key, value)
+        self.quality = min(max(self.quality, 10), 100)
+        self.fps = min(max(self.fps, 1.0), 30.0)
+
+    def as_dict(self):
+        return {'width': self.width, 'quality': self.quality, 'fps': self.fps}
+
+
+class StreamHub:
+    """Fans encoded camera frames out to connected SocketIO clients.
+
+    Clients that opt in with the `stream_options` event receive raw JPEG
+    bytes as a binary attachment and must acknowledge every frame. A client
+    with `max_pending` unacknowledged frames is skipped until it catches up,
+    so a slow link drops frames instead of queueing them. Everybody else
+    gets the legacy base64 frames, through `LEGACY_ROOM`. Nothing is encoded
+    while nobody is watching.
+
+    Acknowledgements only work where the clients are connected, so a
+    recognition worker runs its hub in one of two other modes:
+
+    * 'raw': one binary frame per capture goes to the parent process, whose
+      hub fans it out with `publish` (the multiprocessing relay);
+    * 'rooms': binary frames go to `BINARY_ROOM` and base64 frames to
+      `LEGACY_ROOM` without acknowledgements, through the message queue.
+      The worker cannot see who is connected, so it always encodes.
+    """
+
+    ACK_TIMEOUT = 2.0
+    BINARY_ROOM = 'stream:binary'
+    LEGACY_ROOM = 'stream:legacy'
+    MODES = ('local', 'raw', 'rooms')
+
+    def __init__(self, socketio, settings=None, mode='local'):
+        self.socketio = socketio
+        self.settings = settings or StreamSettings()
+        self.mode = mode
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self._clients = {}
+        self._legacy = set()
+        self._lock = threading.Lock()
+
+    def connect(self, sid):
+        """Count a new connection as a legacy viewer until it subscribes."""
+        with self._lock:
+            self._legacy.add(sid)
+
+    def subscribe(self, sid, binary=True):
+        with self._lock:
+            if binary:
+                self._legacy.discard(sid)
+                self._clients[sid] = {'pending': 0, 'last_ack': time.time()}
+            else:
+                self._clients.pop(sid, None)
+                self._legacy.add(sid)
+
+    def unsubscribe(self, sid):
+        with self._lock:
+            self._clients.pop(sid, None)
+            self._legacy.discard(sid)
+
+    @property
+    def viewers(self):
+        return len(self._clients) + len(self._legacy)
+
+    def _ack(self, sid):
+        with self._lock:
+            client = self._clients.get(sid)
+            if client:
+                client['pending'] = max(client['pending'] - 1, 0)
+                client['last_ack'] = time.time()
+
+    def encode(self, frame):
+        height, width = frame.shape[:2]
+        if self.settings.width and width > self.settings.width:
+            height = int(height * self.settings.width / width)
+            width = self.settings.width
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.settings.quality])
+        return (buffer.tobytes() if ret else None), width, height
+
+    def send(self, frame, seq):
+        if self.mode == 'local' and not self.viewers:
+            return
+        jpeg, width, height = self.encode(frame)
+        if jpeg is None:
+            return
+        payload = {'image': jpeg, 'binary': True, 'seq': seq, 'width': width, 'height': height}
+        if self.mode == 'raw':
+            self.socketio.emit('camera_frame', payload)
+        elif self.mode == 'rooms':
+            self.socketio.emit('camera_frame', payload, to=self.BINARY_ROOM)
+            self.socketio.emit('camera_frame', {'image': base64.b64encode(jpeg).decode('utf-8')},
+                               to=self.LEGACY_ROOM)
+            self.frames_sent += 1
+        else:
+            self.publish(jpeg, seq, width, height)
+
+    def publish(self, jpeg, seq, width, height):
+        """Send an encoded frame to this process's clients, with acknowledgements."""
+        now = time.time()
+        ready = []
+        with self._lock:
+            legacy = bool(self._legacy)
+            for sid, client in self._clients.items():
+                if client['pending'] and now - client['last_ack'] > self.ACK_TIMEOUT:
+                    # The client stopped acknowledging; don't stall it forever
+                    client['pending'] = 0
+                if client['pending'] >= self.settings.max_pending:
+                    self.frames_dropped += 1
+                    continue
+                client['pending'] += 1
+                ready.append(sid)
+
+        payload = {'image': jpeg, 'binary': True, 'seq': seq, 'width': width, 'height': height}
+        for sid in ready:
+            self.socketio.emit('camera_frame', payload, to=sid,
+                               callback=lambda *args, sid=sid: self._ack(sid))
+            self.frames_sent += 1
+
+        if legacy:
+            self.socketio.emit('camera_frame', {'image': base64.b64encode(jpeg).decode('utf-8')},
+                               to=self.LEGACY_ROOM)
@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+_MISSING = object()
+
+
+class StudentCache:
+    """Bounded LRU cache of serialized student payloads keyed by card id.
+
+    Entries expire after `ttl` seconds. Misses go through `loader(card_id)`,
+    which returns the payload or None; unknown ids are cached too so a
+    stranger in front of the camera doesn't cost a query per frame.
+    """
+
+    def __init__(self, loader, max_size=None, ttl=None):
+        self.loader = loader
+        self.max_size = int(max_size if max_size is not None else os.getenv('STUDENT_CACHE_SIZE', 10000))
+        # 0 disables caching: every entry is already expired when it is read
+        self.ttl = float(ttl if ttl is not None else os.getenv('STUDENT_CACHE_TTL', 300))
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, card_id):
+        with self._lock:
+            entry = self._entries.get(card_id)
+            if entry is None or entry[0] < time.monotonic():
+                return _MISSING
+            self._entries.move_to_end(card_id)
+            return entry[1]
+
+    def put(self, card_id, payload):
+        with self._lock:
+            self._entries[int(card_id)] = (time.monotonic() + self.ttl, payload)
+            self._entries.move_to_end(int(card_id))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, card_id):
+        try:
+            card_id = int(card_id)
+        except (TypeError, ValueError):
+            return None
+        payload = self._lookup(card_id)
+        if payload is not _MISSING:
+            self.hits += 1
+            return payload
+        self.misses += 1
+        payload = self.loader(card_id)
+        self.put(card_id, payload)
+        return payload
+
+    def warm(self, items):
+        """Preload (card_id, payload) pairs, e.g. from one bulk query at startup."""
+        for count, (card_id, payload) in enumerate(items):
+            if count >= self.max_size:
+                break
+            self.put(card_id, payload)
+
+    def invalidate(self, card_id=None):
+        with self._lock:
+            if card_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(int(card_id), None)
+
+
+def message_queue_manager(url, channel):
+    """python-socketio's pub/sub manager for `url`, as Flask-SocketIO picks it."""
+    import socketio
+
+    if url.startswith(('redis://', 'rediss://')):
+        manager_class = socketio.RedisManager
+    elif url.startswith('kafka://'):
+        manager_class = socketio.KafkaManager
+    elif url.startswith('zmq'):
+        manager_class = socketio.ZmqManager
+    else:
+        manager_class = socketio.KombuManager
+    return manager_class(url, channel=channel)
+
+
+class InvalidationChannel:
+    """Carries student cache invalidations to the other processes.
+
+    Every process keeps its own StudentCache, so a change made through one
+    web process must reach the recognition worker, and other web replicas,
+    before their TTL runs out. Messages travel over `commands`, the queue a
+    web process shares with the worker it spawned, or over a separate
+    channel of the SocketIO message queue at `url`. `listen` runs in a
+    daemon thread of each receiving process.
+    """
+
+    CHANNEL = 'student-cache'
+
+    def __init__(self, commands=None, url=None):
+        self.commands = commands
+        self._manager = message_queue_manager(url, self.CHANNEL) if url else None
+
+    def publish(self, card_id=None):
+        """Invalidate `card_id` (None for everything) in the other processes."""
+        try:
+            if self.commands is not None:
+                self.commands.put_nowait(card_id)
+            if self._manager is not None:
+                self._manager._publish({'card_id': card_id})
+        except Exception as e:
+            print(f"[ERROR] Cannot broadcast student cache invalidation: {e}")
+
+    def listen(self, invalidate):
+        if self.commands is not None:
+            while True:
+                try:
+                    invalidate(self.commands.get())
+                except (EOFError, OSError):
+                    return
+        for message in self._manager._listen():
+            try:
+                invalidate((message if isinstance(message, dict) else json.loads(message))['card_id'])
+            except (KeyError, TypeError, ValueError):
+                continue
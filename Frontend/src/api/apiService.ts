@@ -75,9 +75,13 @@ export const apiService = {
     }
   },
   
-  getUnassignedCards: async () => {
+  getUnassignedCards: async (params: { dept?: string; page?: number; perPage?: number } = {}) => {
     try {
-      const response = await fetch(`${API_BASE_URL}/unassigned-cards`);
+      const query = new URLSearchParams();
+      if (params.dept) query.set('dept', params.dept);
+      query.set('page', String(params.page ?? 1));
+      query.set('per_page', String(params.perPage ?? 1000));
+      const response = await fetch(`${API_BASE_URL}/unassigned-cards?${query}`);
       return await response.json();
     } catch (error) {
       console.error('Error getting unassigned cards:', error);
@@ -8,6 +8,12 @@ const socket = io('http://localhost:5000');
 const AssignFace: React.FC = () => {
   const [unassignedCards, setUnassignedCards] = useState<number[]>([]);
   const [selectedCard, setSelectedCard] = useState<number | null>(null);
+  // The roster can be larger than one response, so cards are listed a page at a time
+  const [cardPage, setCardPage] = useState(1);
+  const [cardPages, setCardPages] = useState(1);
+  const [cardTotal, setCardTotal] = useState(0);
+  const [deptFilter, setDeptFilter] = useState('');
+  const [cardsVersion, setCardsVersion] = useState(0);
   const [isCameraActive, setIsCameraActive] = useState(false);
   const [captureMode, setCaptureMode] = useState<'camera' | 'upload'>('camera');
   const [isProcessing, setIsProcessing] = useState(false);
@@ -20,12 +26,42 @@ const AssignFace: React.FC = () => {
   const fileInputRef = useRef<HTMLInputElement>(null);
   
   useEffect(() => {
-    fetchUnassignedCards();
-    
+    fetchUnassignedCards(cardPage, deptFilter);
+  }, [cardPage, deptFilter, cardsVersion]);
+
+  useEffect(() => {
+    // Ask for raw JPEG frames; each one is acknowledged so the server can drop frames when we fall behind
+    const requestBinaryFrames = () => socket.emit('stream_options', { binary: true });
+    requestBinaryFrames();
+    socket.on('connect', requestBinaryFrames);
+
     // Listen for camera frames
-    socket.on('camera_frame', (data) => {
+    socket.on('camera_frame', (data, ack?: () => void) => {
       if (videoRef.current && isCameraActive) {
-        videoRef.current.src = `data:image/jpeg;base64,${data.image}`;
+        if (data.binary) {
+          const previous = videoRef.current.src;
+          videoRef.current.src = URL.createObjectURL(new Blob([data.image], { type: 'image/jpeg' }));
+          if (previous.startsWith('blob:')) URL.revokeObjectURL(previous);
+        } else {
+          videoRef.current.src = `data:image/jpeg;base64,${data.image}`;
+        }
+      }
+      if (ack) ack();
+    });
+    
+    // Enrollment runs as a background job; its outcome arrives here
+    socket.on('enrollment_job', (job) => {
+      if (job.status === 'done') {
+        setStatusMessage({
+          type: 'success',
+          message: job.kind === 'capture' ? 'Image captured successfully!' : 'Image assigned successfully!'
+        });
+        setCardsVersion((version) => version + 1);
+      } else if (job.status === 'failed') {
+        setStatusMessage({
+          type: 'error',
+          message: job.error || 'Enrollment failed. Please try again.'
+        });
       }
     });
     
@@ -42,7 +78,9 @@ const AssignFace: React.FC = () => {
     });
     
     return () => {
+      socket.off('connect', requestBinaryFrames);
       socket.off('camera_frame');
+      socket.off('enrollment_job');
       socket.off('image_captured');
       
       // Stop camera on unmount if active
@@ -52,12 +90,16 @@ const AssignFace: React.FC = () => {
     };
   }, [isCameraActive]);
   
-const fetchUnassignedCards = async () => {
+const fetchUnassignedCards = async (page: number, dept: string) => {
   try {
     console.log('Attempting to fetch unassigned cards...');
-    const cards = await apiService.getUnassignedCards();
+    const cards = await apiService.getUnassignedCards({ dept: dept || undefined, page, perPage: 200 });
     console.log('Received cards:', cards);
-    setUnassignedCards(cards);
+    setUnassignedCards(cards.items.map((card: { id: number }) => card.id));
+    setCardPages(Math.max(cards.pages, 1));
+    setCardTotal(cards.total);
+    // Enrolling the last card of the last page leaves that page empty
+    if (cards.pages > 0 && page > cards.pages) setCardPage(cards.pages);
   } catch (error) {
     console.error('Full error details:', error);
     setStatusMessage({
@@ -129,12 +171,12 @@ const fetchUnassignedCards = async () => {
           message: response.error
         });
       } else {
+        // Only this socket hears how the job ends
+        socket.emit('watch_enrollment_job', { job_id: response.job_id });
         setStatusMessage({
-          type: 'success',
-          message: 'Image captured successfully!'
+          type: 'info',
+          message: 'Image captured. Checking for a face...'
         });
-        // Refresh the list of unassigned cards
-        fetchUnassignedCards();
       }
     } catch (error) {
       setStatusMessage({
@@ -179,12 +221,11 @@ const fetchUnassignedCards = async () => {
               message: response.error
             });
           } else {
+            socket.emit('watch_enrollment_job', { job_id: response.job_id });
             setStatusMessage({
-              type: 'success',
-              message: 'Image assigned successfully!'
+              type: 'info',
+              message: 'Image uploaded. Checking for a face...'
             });
-            // Refresh the list of unassigned cards
-            fetchUnassignedCards();
           }
         } catch (error) {
           setStatusMessage({
@@ -238,6 +279,14 @@ const fetchUnassignedCards = async () => {
           <label className="block text-sm font-medium text-gray-700 mb-2">
             Select Student ID
           </label>
+          <input
+            type="text"
+            value={deptFilter}
+            onChange={(e) => { setDeptFilter(e.target.value); setCardPage(1); }}
+            placeholder="Filter by department"
+            className="w-full px-3 py-2 mb-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500"
+            disabled={isProcessing || isCameraActive}
+          />
           <select
             value={selectedCard || ''}
             onChange={(e) => setSelectedCard(e.target.value ? Number(e.target.value) : null)}
@@ -249,6 +298,27 @@ const fetchUnassignedCards = async () => {
               <option key={id} value={id}>{id}</option>
             ))}
           </select>
+          {cardPages > 1 && (
+            <div className="flex items-center justify-between mt-2 text-sm text-gray-600">
+              <button
+                type="button"
+                onClick={() => setCardPage((page) => Math.max(page - 1, 1))}
+                disabled={cardPage <= 1 || isProcessing || isCameraActive}
+                className="px-3 py-1 border border-gray-300 rounded-md disabled:opacity-50"
+              >
+                Previous
+              </button>
+              <span>Page {cardPage} of {cardPages} ({cardTotal} unassigned)</span>
+              <button
+                type="button"
+                onClick={() => setCardPage((page) => Math.min(page + 1, cardPages))}
+                disabled={cardPage >= cardPages || isProcessing || isCameraActive}
+                className="px-3 py-1 border border-gray-300 rounded-md disabled:opacity-50"
+              >
+                Next
+              </button>
+            </div>
+          )}
           {unassignedCards.length === 0 && (
             <p className="mt-2 text-sm text-gray-500">
               No unassigned students found. All students have face data or no students are registered.
@@ -32,10 +32,22 @@ const TestCamera: React.FC = () => {
   const videoRef = useRef<HTMLImageElement>(null);
   
 useEffect(() => {
-  socket.on('camera_frame', (data) => {
+  // Ask for raw JPEG frames; each one is acknowledged so the server can drop frames when we fall behind
+  const requestBinaryFrames = () => socket.emit('stream_options', { binary: true });
+  requestBinaryFrames();
+  socket.on('connect', requestBinaryFrames);
+
+  socket.on('camera_frame', (data, ack?: () => void) => {
     if (videoRef.current) {
-      videoRef.current.src = `data:image/jpeg;base64,${data.image}`;
+      if (data.binary) {
+        const previous = videoRef.current.src;
+        videoRef.current.src = URL.createObjectURL(new Blob([data.image], { type: 'image/jpeg' }));
+        if (previous.startsWith('blob:')) URL.revokeObjectURL(previous);
+      } else {
+        videoRef.current.src = `data:image/jpeg;base64,${data.image}`;
+      }
     }
+    if (ack) ack();
   });
   
   socket.on('face_recognition_result', (data) => {
@@ -56,6 +68,7 @@ useEffect(() => {
   });
   
   return () => {
+    socket.off('connect', requestBinaryFrames);
     socket.off('camera_frame');
     socket.off('face_recognition_result');
     apiService.stopCamera().catch(console.error);